@@ -0,0 +1,180 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Optional, Tuple
+import redis
+from django.core import serializers
+from django.core.serializers.base import DeserializationError
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from .models import User
+from .redis_client import get_redis, get_version, bump_version
+
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 60  # seconds, also the longest a revocation can go unseen by a process without Redis
+
+
+def token_digest(key: str) -> str:  # raw keys are never used as cache keys
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_epoch_key(user_pk: int) -> str:
+    return f"cauth:token:user:{user_pk}:epoch"
+
+
+def dump_token(token: Token, expires: float, epoch: Optional[int]) -> str:  # JSON, never pickle, for the shared Redis
+    return json.dumps({
+        "expires": expires,
+        "epoch": epoch,
+        "token": serializers.serialize("json", [token]),
+        "user": serializers.serialize("json", [token.user], fields=[f.name for f in User._meta.concrete_fields]),
+    })
+
+
+def load_token(raw) -> Tuple[float, Optional[int], Token]:
+    data = json.loads(raw)
+    token, user = (next(serializers.deserialize("json", data[key])).object for key in ("token", "user"))
+    for obj in (token, user):
+        obj._state.adding, obj._state.db = False, DEFAULT_DB_ALIAS
+    token.user = user
+    return data["expires"], data["epoch"], token
+
+
+def copy_token(token: Token) -> Token:  # callers get their own instances with an empty roles memo
+    token, user = copy.copy(token), copy.copy(token.user)
+    user.reset_roles()
+    token.user = user
+    return token
+
+
+class TokenCache:  # digest -> token with its user: bounded LRU in process, JSON in the channel layer's Redis
+    def __init__(self, size: int = TOKEN_CACHE_SIZE, ttl: int = TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # digest -> (expires, epoch, token)
+        self._by_user = defaultdict(set)
+        self._epochs = defaultdict(int)  # user pk -> revocations in this process, used when there is no shared Redis
+
+    @staticmethod
+    def _redis_key(digest: str) -> str:
+        return f"cauth:token:{digest}"
+
+    def _unlink(self, user_pk: int, digest: str):  # under the lock
+        digests = self._by_user.get(user_pk)
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[user_pk]
+
+    def _remember(self, digest: str, expires: float, epoch: Optional[int], token: Token):
+        with self._lock:
+            self._entries[digest] = (expires, epoch, token)
+            self._entries.move_to_end(digest)
+            self._by_user[token.user_id].add(digest)
+            while len(self._entries) > self.size:
+                old_digest, (_, _, old_token) = self._entries.popitem(last=False)
+                self._unlink(old_token.user_id, old_digest)
+
+    def _forget(self, digest: str):
+        with self._lock:
+            entry = self._entries.pop(digest, None)
+            if entry is not None:
+                self._unlink(entry[2].user_id, digest)
+
+    def epoch(self, user_pk: int) -> Optional[int]:  # None when the shared Redis can't be read, nothing is cached then
+        if get_redis() is None:
+            with self._lock:
+                return self._epochs[user_pk]
+        return get_version(user_epoch_key(user_pk))
+
+    def get(self, key: str) -> Optional[Token]:
+        digest = token_digest(key)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+        if entry is not None and entry[0] <= time.monotonic():
+            self._forget(digest)
+            entry = None
+        if entry is None:
+            entry = self._shared_get(digest)
+            if entry is None:
+                return None
+            self._remember(digest, *entry)
+        epoch = self.epoch(entry[2].user_id)
+        if epoch is None:  # revocations can't be seen, fail closed
+            return None
+        if epoch != entry[1]:  # revoked, possibly by another process
+            self._forget(digest)
+            return None
+        return copy_token(entry[2])
+
+    def set(self, key: str, token: Token, epoch: Optional[int]):  # epoch read before the token was loaded
+        if epoch is None or self.epoch(token.user_id) != epoch:  # revoked while loading
+            return
+        digest = token_digest(key)
+        token = copy_token(token)
+        self._remember(digest, time.monotonic() + self.ttl, epoch, token)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.setex(self._redis_key(digest), self.ttl, dump_token(token, time.time() + self.ttl, epoch))
+            except redis.RedisError:
+                pass
+
+    def _shared_get(self, digest: str):
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            raw = client.get(self._redis_key(digest))
+        except redis.RedisError:
+            return None
+        if not raw:
+            return None
+        try:
+            expires, epoch, token = load_token(raw)
+        except (ValueError, KeyError, TypeError, DeserializationError):  # e.g. written by an older release
+            return None
+        return time.monotonic() + (expires - time.time()), epoch, token  # keeps the shared expiry
+
+    def revoke(self, key: str):
+        digest = token_digest(key)
+        self._forget(digest)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.delete(self._redis_key(digest))
+            except redis.RedisError:
+                pass
+
+    def revoke_user(self, user_pk: int):  # every token of the user, in every process sharing the Redis
+        with self._lock:
+            for digest in self._by_user.pop(user_pk, set()):
+                self._entries.pop(digest, None)
+            self._epochs[user_pk] += 1
+        bump_version(user_epoch_key(user_pk))
+
+
+token_cache = TokenCache()
+
+
+def authenticate_token(key: str) -> Tuple[User, Token]:  # raises AuthenticationFailed like TokenAuthentication
+    token = token_cache.get(key)
+    if token is None:
+        user_pk = Token.objects.filter(key=key).values_list("user_id", flat=True).first()  # the epoch is read before the user
+        epoch = token_cache.epoch(user_pk) if user_pk is not None else None
+        _, token = TokenAuthentication().authenticate_credentials(key)
+        if token.user_id == user_pk:
+            token_cache.set(key, token, epoch)
+    return token.user, token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        return authenticate_token(key)
@@ -0,0 +1,56 @@
+import heapq
+import re
+from typing import Callable, Hashable, Iterable, List, Tuple
+from .models import Skills, Requirements, RequirementOptions
+from .redis_client import SharedState
+
+AUTOCOMPLETE_LIMIT = 20
+WORD_START = re.compile(r"\b\w")  # first character of every word
+
+
+class PrefixIndex(SharedState):  # trie over the start of every word, each node keeps its best AUTOCOMPLETE_LIMIT matches
+    def __init__(self, name: str, load: Callable[[], Iterable[Tuple[int, str, Hashable]]]):  # load() -> (pk, text, group)
+        super().__init__(f"cauth:autocomplete:{name}:version")
+        self.load = load
+
+    def build(self):
+        best = {}  # group -> trie with node[""] = {pk: rank} while building
+        for pk, text, group in self.load():
+            root = best.setdefault(group, {"": {}})
+            lowered = text.lower()
+            for position, match in enumerate(WORD_START.finditer(lowered)):
+                rank = (position > 0, len(text), lowered, pk)  # name start before inner word, then shorter names
+                node = root
+                for char in lowered[match.start():]:
+                    node = node.setdefault(char, {"": {}})
+                    if pk not in node[""] or rank < node[""][pk]:
+                        node[""][pk] = rank
+        for root in best.values():
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                node[""] = heapq.nsmallest(AUTOCOMPLETE_LIMIT, node[""].values())
+                stack.extend(v for k, v in node.items() if k)
+        return best
+
+    def _tries(self):
+        return self.current()[2]
+
+    def search(self, part: str, groups: Iterable[Hashable] = (None,), limit: int = AUTOCOMPLETE_LIMIT) -> List[int]:
+        part = part.lower().strip()
+        tries = self._tries()
+        ranked = []
+        for group in groups:
+            node = tries.get(group)
+            for char in part:
+                if node is None:
+                    break
+                node = node.get(char)
+            if node is not None:
+                ranked.extend(node[""])
+        return [rank[-1] for rank in heapq.nsmallest(limit, ranked)]
+
+
+skills_autocomplete = PrefixIndex("skills", lambda: ((pk, name, None) for pk, name in Skills.objects.values_list("pk", "name")))
+requirements_autocomplete = PrefixIndex("requirements", lambda: Requirements.objects.values_list("pk", "name", "requirement_type__name"))
+options_autocomplete = PrefixIndex("options", lambda: RequirementOptions.objects.values_list("pk", "value", "requirement_id"))
@@ -1,13 +1,17 @@
 import django_filters
 from .models import Vacancy, Requirements, Skills, RequirementOptions, WorkerExtras
+from .search import search_vacancies
 class VacanciesFilter(django_filters.FilterSet):
     title = django_filters.CharFilter(field_name="title", lookup_expr="icontains")
     requirements = django_filters.ModelMultipleChoiceFilter(field_name="related_vr__requirement", queryset=Requirements.objects.all())
     skills = django_filters.ModelMultipleChoiceFilter(field_name="related_vs__skill", queryset=Skills.objects.all())
     options = django_filters.ModelMultipleChoiceFilter(field_name="related_vr__related_vmo__option", queryset=RequirementOptions.objects.all())
+    q = django_filters.CharFilter(method="search")  # full-text over title and description, ranked
     class Meta:
         model = Vacancy
         fields = ["title", "hr", "requirements", "skills"]
+    def search(self, queryset, name, value):
+        return search_vacancies(queryset, value)
 class WorkerExtrasFilter(django_filters.FilterSet):
     requirements = django_filters.ModelMultipleChoiceFilter(field_name="related_rw__requirement", queryset=Requirements.objects.all())
     skills = django_filters.ModelMultipleChoiceFilter(field_name="related_sw__skill", queryset=Skills.objects.all())
@@ -0,0 +1,140 @@
+import os
+import multiprocessing
+import numpy as np
+from collections import Counter, defaultdict
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+from cauth.models import WorkerExtras, Vacancy, RecommendationGenerations, recommended_vacancies, recommended_workers, vacancy_skills, skills_workers
+from cauth.relevance import skill_weights
+from cauth.skill_index import vacancy_index, worker_index
+
+
+EMPTY = (np.array([], dtype=np.int64), np.array([]))
+_postings = None  # set once per run and inherited by the pool processes, see load_postings
+
+
+def load_postings():  # both sides as skill -> (owner ids, weights), read once instead of per chunk
+    vacancy_rows = defaultdict(list)
+    for vacancy_id, skill_id, relevance in vacancy_skills.objects.filter(vacancy__visible=True).values_list("vacancy_id", "skill_id", "relevance"):
+        vacancy_rows[vacancy_id].append((skill_id, relevance))
+    vacancies = {vacancy_id: skill_weights(rows) for vacancy_id, rows in vacancy_rows.items()}
+    workers = defaultdict(Counter)
+    for worker_id, skill_id in skills_workers.objects.values_list("worker_id", "skill_id"):
+        workers[worker_id][skill_id] += 1  # duplicated skill rows are counted like in RelevanceMatrix
+    return {
+        "vacancies": {v: as_arrays(weights) for v, weights in vacancies.items()},
+        "workers": {w: as_arrays(counts) for w, counts in workers.items()},
+        "vacancies_by_skill": invert(vacancies),
+        "workers_by_skill": invert(workers),
+    }
+
+
+def as_arrays(weights: dict):
+    return np.fromiter(weights.keys(), dtype=np.int64, count=len(weights)), np.fromiter(weights.values(), dtype=np.float64, count=len(weights))
+
+
+def invert(owners: dict) -> dict:  # owner -> {skill: weight} to skill -> (owner ids, weights)
+    by_skill = defaultdict(dict)
+    for owner_id, weights in owners.items():
+        for skill_id, weight in weights.items():
+            by_skill[skill_id][owner_id] = weight
+    return {skill_id: as_arrays(weights) for skill_id, weights in by_skill.items()}
+
+
+def set_postings(postings):  # pool initializer
+    global _postings
+    _postings = postings
+
+
+def score(have, postings: dict):  # (skill ids, weights) of one side -> (owner ids, relevance) of the owners sharing a skill
+    ids, values = [], []
+    for skill_id, weight in zip(*have):
+        if skill_id in postings:
+            owners, weights = postings[skill_id]
+            ids.append(owners)
+            values.append(weights * weight)
+    if not ids:
+        return EMPTY
+    owners, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+    return owners, np.bincount(inverse, weights=np.concatenate(values))
+
+
+def top_n(owner_id: int, have, postings: dict, top: int):  # [(owner_id, other_id, rank, relevance)] by relevance desc, then pk order
+    others, scores = score(have, postings)
+    order = np.lexsort((others, -scores))[:top]
+    return [(owner_id, int(others[i]), rank, float(scores[i])) for rank, i in enumerate(order, start=1)]
+
+
+def recommend_vacancies(args):  # runs in a pool process
+    worker_ids, top = args
+    return [row for w in worker_ids for row in top_n(w, _postings["workers"].get(w, EMPTY), _postings["vacancies_by_skill"], top)]
+
+
+def recommend_workers(args):  # runs in a pool process
+    vacancy_ids, top = args
+    return [row for v in vacancy_ids for row in top_n(v, _postings["vacancies"].get(v, EMPTY), _postings["workers_by_skill"], top)]
+
+
+class Command(BaseCommand):
+    help = "Precompute top-N vacancy recommendations for workers and top-N candidates for visible vacancies"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20)
+        parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--chunk-size", type=int, default=200)
+        parser.add_argument("--full", action="store_true", help="recompute everything instead of changes since the last watermark")
+
+    def handle(self, *args, **options):
+        last = RecommendationGenerations.last_finished()
+        full = options["full"] or last is None
+        generation = RecommendationGenerations.objects.create(watermark=timezone.now(), full=full)
+
+        worker_ids, vacancy_ids = self.changed_entities(None if full else last.watermark)
+        self.stdout.write(f"Generation {generation.pk}: {len(worker_ids)} workers, {len(vacancy_ids)} vacancies to recompute")
+
+        chunk_size, top = options["chunk_size"], options["top"]
+        worker_chunks = [(worker_ids[i:i+chunk_size], top) for i in range(0, len(worker_ids), chunk_size)]
+        vacancy_chunks = [(vacancy_ids[i:i+chunk_size], top) for i in range(0, len(vacancy_ids), chunk_size)]
+        postings = load_postings()
+        if options["processes"] > 1 and len(worker_chunks) + len(vacancy_chunks) > 1:
+            connections.close_all()  # forked children must open their own connections
+            with multiprocessing.Pool(options["processes"], initializer=set_postings, initargs=(postings,)) as pool:
+                vacancy_results = pool.map(recommend_vacancies, worker_chunks)
+                worker_results = pool.map(recommend_workers, vacancy_chunks)
+        else:
+            set_postings(postings)
+            vacancy_results = list(map(recommend_vacancies, worker_chunks))
+            worker_results = list(map(recommend_workers, vacancy_chunks))
+
+        with transaction.atomic():
+            recommended_vacancies.objects.filter(worker_id__in=worker_ids).delete()
+            recommended_vacancies.objects.bulk_create([
+                recommended_vacancies(worker_id=w, vacancy_id=v, rank=rank, relevance=relevance, generation=generation)
+                for chunk in vacancy_results for w, v, rank, relevance in chunk
+            ], batch_size=1000)
+            recommended_workers.objects.filter(vacancy_id__in=vacancy_ids).delete()
+            recommended_workers.objects.filter(vacancy__visible=False).delete()
+            recommended_workers.objects.bulk_create([
+                recommended_workers(vacancy_id=v, worker_id=w, rank=rank, relevance=relevance, generation=generation)
+                for chunk in worker_results for v, w, rank, relevance in chunk
+            ], batch_size=1000)
+            generation.finished = timezone.now()
+            generation.save()
+        self.stdout.write(self.style.SUCCESS(f"Generation {generation.pk} finished"))
+
+    def changed_entities(self, watermark):
+        if watermark is None:
+            return (list(WorkerExtras.objects.order_by("pk").values_list("pk", flat=True)),
+                    list(Vacancy.objects.filter(visible=True).order_by("pk").values_list("pk", flat=True)))
+        changed_workers = set(WorkerExtras.objects.filter(matching_updated__gte=watermark).values_list("pk", flat=True))
+        changed_vacancies = set(Vacancy.objects.filter(matching_updated__gte=watermark).values_list("pk", flat=True))
+        # the other side's top-N moves only where a skill is shared with a changed entity now or was before
+        workers = changed_workers | set(recommended_vacancies.objects.filter(vacancy_id__in=changed_vacancies).values_list("worker_id", flat=True))
+        for vacancy_id in changed_vacancies:
+            workers.update(worker_index.owners_of(vacancy_index.skills_of(vacancy_id)).tolist())
+        vacancies = changed_vacancies | set(recommended_workers.objects.filter(worker_id__in=changed_workers).values_list("vacancy_id", flat=True))
+        for worker_id in changed_workers:
+            vacancies.update(vacancy_index.owners_of(worker_index.skills_of(worker_id)).tolist())
+        visible = set(Vacancy.objects.filter(pk__in=vacancies, visible=True).values_list("pk", flat=True))
+        return sorted(workers), sorted(visible)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from cauth.models import Vacancy
+from cauth.relevance import refresh_vacancy_relevance
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored worker/vacancy relevance of every vacancy, e.g. after deploying it or writes that skipped signals"
+
+    def handle(self, *args, **options):
+        count = 0
+        for vacancy_id in Vacancy.objects.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=500):
+            refresh_vacancy_relevance(vacancy_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} vacancies rebuilt"))
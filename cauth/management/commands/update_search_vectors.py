@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from cauth.search import full_text_enabled, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = "Rebuild vacancy full-text search vectors, e.g. after a bulk import that skipped signals"
+
+    def handle(self, *args, **options):
+        if not full_text_enabled():
+            self.stdout.write("Full-text search needs PostgreSQL, nothing to do")
+            return
+        update_search_vectors()
+        self.stdout.write(self.style.SUCCESS("Search vectors updated"))
@@ -2,7 +2,10 @@ from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import BaseUserManager
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from typing import Union, List, Tuple
+from . import reference_cache
 
 def fill_db():
     for i in [Role, RequirementTypes, Requirements, RequirementOptions, ComplainReasons, SkillTags, Skills, VacancyResponseStatuses]:
@@ -182,21 +185,37 @@ class User(AbstractUser):
     roles = models.ManyToManyField(to="Role", through="users_roles", through_fields=("user", "role"))
 
     def add_role(self, name: str):
-        primary_role = Role.objects.get(name=name)
+        primary_role = reference_cache.roles.get(name)
         users_roles.objects.create(user=self, role=primary_role)
+        self.reset_roles()
         if primary_role.extras_content_type:
             return primary_role.extras_content_type.model_class().objects.create(user=self)
         return None
 
+    def __roles(self):  # role pk -> users_roles with the role and both extras joined, one query per instance (so per request)
+        memo = self.__dict__.get("_roles_memo")
+        if memo is None:
+            memo = {mw.role_id: mw for mw in users_roles.objects.filter(user=self).select_related("role", "role__extras_content_type", "user__related_workers", "user__related_hrs")}
+            self._roles_memo = memo
+        return memo
+
+    def reset_roles(self):
+        self.__dict__.pop("_roles_memo", None)
+
+    def has_role(self, name: str) -> bool:
+        return any(mw.role.name == name for mw in self.__roles().values())
     
     def __get_mw_for_role(self, role: Union[str, "Role"]):
         if type(role) is str:
-            role = Role.objects.get(name=role)
+            role = reference_cache.roles.get(role)
         elif type(role) is Role:
             pass
         else:
             raise ValueError("Bad input")
-        return users_roles.objects.get(user=self, role=role)
+        try:
+            return self.__roles()[role.pk]
+        except KeyError:
+            raise users_roles.DoesNotExist(f"User has no role {role.name}")
 
     def get_extras_for_role(self, role: Union[str, "Role"]):
         mw_instance = self.__get_mw_for_role(role)
@@ -204,26 +223,24 @@ class User(AbstractUser):
     
     def delete_extras_for_role(self, role: Union[str, "Role"]):
         self.__get_mw_for_role(role).delete_extras()
+        self.reset_roles()
 
     
     def delete_role(self, role: Union[str, "Role"]):
         mw_instance = self.__get_mw_for_role(role)
         mw_instance.delete()
+        self.reset_roles()
     
     def get_related_extras(self):
         res = {}
-        try:
-            w = self.related_workers
-            res["Worker"] = w.pk
-        except:
-            pass
-        try:
-            h = self.related_hrs
-            res["HR"] = h.pk
-        except:
-            pass
-        if "Moderator" in self.roles.values_list("name", flat=True):
-            res["Moderator"] = 1
+        for mw in self.__roles().values():
+            if mw.role.name == "Moderator":
+                res["Moderator"] = 1
+            elif mw.role.extras_content_type:
+                try:
+                    res[mw.role.name] = mw.get_extras().pk
+                except ValueError:
+                    pass
         return res
 
 
@@ -250,6 +267,9 @@ class users_roles(models.Model):
     def get_extras(self):
         try:
             extras_model = self.role.extras_content_type.model_class()
+            extras = extras_model._meta.get_field("user").remote_field
+            if extras.is_cached(self.user):  # joined by the roles memo of User
+                return getattr(self.user, extras.get_accessor_name())
             return extras_model.objects.get(user=self.user)
         except extras_model.DoesNotExist:
             raise ValueError("This role is not bound, you might use set_extras before")
@@ -287,6 +307,7 @@ class WorkerExtras(GenericExtras):
     skills = models.ManyToManyField(to="Skills", through="skills_workers", through_fields=("worker", "skill"))
     user = models.OneToOneField(to=User, related_name="related_workers", on_delete=models.CASCADE)
     cv = models.FileField(upload_to="media/cvs", null=True, blank=True)
+    matching_updated = models.DateTimeField(auto_now=True)  # also bumped by cauth.signals on skill/requirement changes
 
     def add_requirement(self, req_instance: "Requirements", options: Union[List["RequirementOptions"], Tuple["RequirementOptions"]]=[], custom_answer: str=None):
         mw_instance = requirement_workers.objects.create(worker=self, requirement=req_instance)
@@ -309,7 +330,7 @@ class WorkerExtras(GenericExtras):
     
     def add_skill(self, skill:Union[str, "Skills"], experience_duration: str=None, experience_level: str=None, description: str=None):
         if type(skill) is str:
-            skill = Skills.objects.get(name=skill)
+            skill = reference_cache.skills.get(skill)
         skills_workers.objects.create(worker=self, skill=skill, experience_duration=experience_duration, experience_level=experience_level, description=description)
     
     def delete_skill(self, skill: Union[str, "Skills"]):
@@ -328,7 +349,7 @@ class WorkerExtras(GenericExtras):
             except Vacancy.DoesNotExist:
                 raise ValueError("Such vacancy does not exists")
         
-        status = VacancyResponseStatuses.objects.get(name="Created")
+        status = reference_cache.response_statuses.get("Created")
         vacancy_responses.objects.create(vacancy=vacancy, worker=self, status=status)
 
 
@@ -445,7 +466,7 @@ class Skills(models.Model):
 
     def add_tag(self, tag:Union[str, "SkillTags"]):
         if type(tag) is str:
-            tag = SkillTags.objects.get(name=tag)
+            tag = reference_cache.skill_tags.get(tag)
         self.tags.add(tag)
     
     def add_tags(self, tags: Union[List[str], List["SkillTags"]]):
@@ -483,7 +504,9 @@ class Vacancy(models.Model):
     description = models.TextField(null=True, blank=True)
     hr = models.ForeignKey(to="HRExtras", on_delete=models.CASCADE, related_name="related_vacancies")
     visible = models.BooleanField(default=False)
+    matching_updated = models.DateTimeField(auto_now=True)  # also bumped by cauth.signals on skill/requirement changes
     skills = models.ManyToManyField(to="Skills", through="vacancy_skills", through_fields=["vacancy", "skill"])
+    search_vector = SearchVectorField(null=True, editable=False)  # title (A) + description (B), maintained by cauth.search
 
     def add_requirement(self, req_instance: "Requirements", options: Union[List["RequirementOptions"], Tuple["RequirementOptions"]]=[], custom_answer: str=None):
         mw_instance = vacancy_requirements.objects.create(vacancy=self, requirement=req_instance)
@@ -506,7 +529,7 @@ class Vacancy(models.Model):
     
     def add_skill(self, skill:Union[str, "Skills"], experience_duration: str=None, experience_level: str=None, description: str=None):
         if type(skill) is str:
-            skill = Skills.objects.get(name=skill)
+            skill = reference_cache.skills.get(skill)
         vacancy_skills.objects.create(vacancy=self, skill=skill, experience_duration=experience_duration, experience_level=experience_level, description=description)
     
     def delete_skill(self, skill: Union[str, "Skills"]):
@@ -525,7 +548,7 @@ class Vacancy(models.Model):
     def __fetch_status(status):
         if type(status) is str:
             try:
-                status = VacancyResponseStatuses.objects.get(name=status)
+                status = reference_cache.response_statuses.get(status)
             except VacancyResponseStatuses.DoesNotExist:
                 raise ValueError(f"Status with name {status} does not exists")
         return status
@@ -541,6 +564,9 @@ class Vacancy(models.Model):
         ob = VacancyQuickResponses.objects.get(related_status=status, name=name)
         ob.delete()
 
+    class Meta:
+        indexes = [GinIndex(fields=["search_vector"])]
+
 
 class vacancy_skills(models.Model):
     skill = models.ForeignKey(to="Skills", on_delete=models.CASCADE, related_name="related_vs")
@@ -604,4 +630,52 @@ class SavedVacancies(models.Model):
     vacancy = models.ForeignKey(to="Vacancy", on_delete=models.CASCADE, related_name="related_saved_by")
 
     def __str__(self):
-        return f"{self.owner} saved {self.vacancy}"
\ No newline at end of file
+        return f"{self.owner} saved {self.vacancy}"
+
+class worker_vacancy_relevance(models.Model):  # materialized skill relevance, only non-zero pairs, maintained by cauth.signals
+    worker = models.ForeignKey(to="WorkerExtras", on_delete=models.CASCADE, related_name="related_relevance")
+    vacancy = models.ForeignKey(to="Vacancy", on_delete=models.CASCADE, related_name="related_relevance")
+    relevance = models.FloatField(default=0)
+    explain = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ("worker", "vacancy")
+        indexes = [
+            models.Index(fields=["vacancy", "-relevance"]),
+            models.Index(fields=["worker", "-relevance"]),
+        ]
+
+
+#-------------------------recommendations--------------------------
+class RecommendationGenerations(models.Model):
+    watermark = models.DateTimeField()  # changes after this moment are picked up by the next run
+    finished = models.DateTimeField(null=True, blank=True)
+    full = models.BooleanField(default=False)
+
+    @classmethod
+    def last_finished(cls):
+        return cls.objects.filter(finished__isnull=False).order_by("-watermark").first()
+
+
+class recommended_vacancies(models.Model):
+    worker = models.ForeignKey(to="WorkerExtras", on_delete=models.CASCADE, related_name="related_recommended_vacancies")
+    vacancy = models.ForeignKey(to="Vacancy", on_delete=models.CASCADE, related_name="related_recommended_to")
+    rank = models.PositiveIntegerField()
+    relevance = models.FloatField()
+    generation = models.ForeignKey(to="RecommendationGenerations", on_delete=models.CASCADE, related_name="related_recommended_vacancies")
+
+    class Meta:
+        ordering = ["rank"]
+        indexes = [models.Index(fields=["worker", "rank"])]
+
+
+class recommended_workers(models.Model):
+    vacancy = models.ForeignKey(to="Vacancy", on_delete=models.CASCADE, related_name="related_recommended_workers")
+    worker = models.ForeignKey(to="WorkerExtras", on_delete=models.CASCADE, related_name="related_recommended_for")
+    rank = models.PositiveIntegerField()
+    relevance = models.FloatField()
+    generation = models.ForeignKey(to="RecommendationGenerations", on_delete=models.CASCADE, related_name="related_recommended_workers")
+
+    class Meta:
+        ordering = ["rank"]
+        indexes = [models.Index(fields=["vacancy", "rank"])]
@@ -0,0 +1,100 @@
+import base64
+import heapq
+import json
+from typing import Callable, Iterable, List, Optional, Tuple
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import Coalesce
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Bad cursor")
+    if type(values) is not list:
+        raise ValueError("Bad cursor")
+    return values
+
+
+def get_limit(data) -> int:
+    limit = data.get("limit", None)
+    if limit in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        raise ValueError("limit must be a number")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def top_k_page(ids: Iterable[int], score: Callable[[int], float], limit: int, cursor: Optional[str] = None) -> Tuple[List[int], Optional[str]]:
+    # ordered by score desc, pk asc; the heap never holds more than limit+1 candidates
+    after = None
+    if cursor:
+        try:
+            after_score, after_pk = decode_cursor(cursor)
+            after = (-float(after_score), int(after_pk))
+        except (ValueError, TypeError):
+            raise ValueError("Bad cursor")
+    candidates = ((-score(pk), pk) for pk in ids)
+    if after is not None:
+        candidates = (i for i in candidates if i > after)
+    page = heapq.nsmallest(limit + 1, candidates)
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor([-page[-1][0], page[-1][1]])
+    return [pk for _, pk in page], next_cursor
+
+
+def ranked_page(queryset: QuerySet, score: str, limit: int, cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    # top_k_page in SQL: ordered by the score column desc, pk asc; rows without a score rank as 0 after the scored ones
+    queryset = queryset.annotate(rank=Coalesce(F(score), 0.0))
+    if cursor:
+        try:
+            after_score, after_pk = decode_cursor(cursor)
+            after_score, after_pk = float(after_score), int(after_pk)
+        except (ValueError, TypeError):
+            raise ValueError("Bad cursor")
+        queryset = queryset.filter(Q(rank__lt=after_score) | Q(rank=after_score, pk__gt=after_pk))
+    page = list(queryset.order_by(F(score).desc(nulls_last=True), "pk")[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor([page[-1].rank, page[-1].pk])
+    return page, next_cursor
+
+
+def keyset_page(queryset: QuerySet, sort: str, limit: int, cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+    # ordered by (sort, pk) and continued with a WHERE on the last seen pair, so a deep page costs the same as the first one
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    lookup = "lt" if descending else "gt"
+    queryset = queryset.annotate(sort_key=F(field))
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != 3 or values[0] != sort:  # a cursor only continues the ordering it was issued for
+            raise ValueError("Bad cursor")
+        _, after_key, after_pk = values
+        if type(after_pk) is not int or type(after_key) not in (str, int, float):  # only what encode_cursor wrote for a column
+            raise ValueError("Bad cursor")
+        try:  # e.g. a string key for a numeric column
+            queryset = queryset.filter(Q(**{f"sort_key__{lookup}": after_key}) | Q(sort_key=after_key, **{f"pk__{lookup}": after_pk}))
+        except (ValueError, TypeError):
+            raise ValueError("Bad cursor")
+    order = "-" if descending else ""
+    page = list(queryset.order_by(f"{order}sort_key", f"{order}pk")[:limit + 1])
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor([sort, page[-1].sort_key, page[-1].pk])
+    return page, next_cursor
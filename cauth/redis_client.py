@@ -0,0 +1,90 @@
+import threading
+import time
+import uuid
+from typing import Optional
+import redis
+from django.conf import settings
+
+REDIS_TIMEOUT = 0.5  # seconds, shared state is an optimization and must not stall requests
+PROCESS_TOKEN = uuid.uuid4().hex  # without Redis versions are per process, so are the etags built from them
+VERSION_CHECK_INTERVAL = 1.0  # seconds a process trusts its copy before comparing versions in Redis again
+
+_client = None
+_lock = threading.Lock()
+
+
+def _connect(host) -> redis.Redis:  # channels_redis accepts urls, (host, port) tuples and dicts with an address
+    if isinstance(host, dict):
+        host = host.get("address", ("127.0.0.1", 6379))
+    if isinstance(host, str):
+        return redis.Redis.from_url(host, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT)
+    return redis.Redis(host=host[0], port=host[1], socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT)
+
+
+def get_redis() -> Optional[redis.Redis]:  # the channel layer's Redis, None when the layer is not Redis-backed
+    global _client
+    if _client is None:
+        layer = settings.CHANNEL_LAYERS.get("default", {})
+        if "redis" not in layer.get("BACKEND", "").lower():
+            return None
+        with _lock:
+            if _client is None:
+                hosts = layer.get("CONFIG", {}).get("hosts") or [("127.0.0.1", 6379)]
+                _client = _connect(hosts[0])
+    return _client
+
+
+def get_version(key: str) -> Optional[int]:  # None when there is no shared Redis or it is unreachable
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        return int(client.get(key) or 0)
+    except redis.RedisError:
+        return None
+
+
+def bump_version(key: str):
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.incr(key)
+    except redis.RedisError:
+        pass
+
+
+class SharedState:  # data built from the database per process, rebuilt when any process bumps its version in Redis
+    def __init__(self, version_key: str):
+        self.version_key = version_key
+        self._lock = threading.Lock()
+        self._state = None  # (version, generation, data)
+        self._checked = 0.0
+        self._generation = 0  # local invalidations, the only version there is without a shared Redis
+
+    def build(self):
+        raise NotImplementedError
+
+    def current(self) -> tuple:  # (version, generation, data), the versions are read before the data
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now - self._checked < VERSION_CHECK_INTERVAL:
+            return state
+        version = get_version(self.version_key)
+        with self._lock:
+            self._checked = now
+            if self._state is None or (version is not None and self._state[0] != version):  # changed by another process
+                self._state = (version, self._generation, self.build())
+            return self._state
+
+    def version(self) -> str:  # version of the data this process serves, not the newest one in Redis
+        version, generation, _ = self.current()
+        if version is None:
+            return f"{PROCESS_TOKEN}.{generation}"
+        return str(version)
+
+    def invalidate(self):  # this process now, the others within VERSION_CHECK_INTERVAL
+        with self._lock:
+            self._state = None
+            self._generation += 1
+        bump_version(self.version_key)
@@ -0,0 +1,79 @@
+import hashlib
+from functools import wraps
+from typing import Dict, Generic, List, Tuple, TypeVar
+from django.apps import apps
+from django.db import models
+from django.utils.http import parse_etags, quote_etag
+from rest_framework.response import Response
+from rest_framework.status import HTTP_304_NOT_MODIFIED
+from .redis_client import SharedState
+
+T = TypeVar("T", bound=models.Model)
+
+
+class ReferenceCache(SharedState, Generic[T]):  # name -> object and pk -> object maps of a rarely changing table, per process
+    def __init__(self, model_label: str, key: str = "name", select_related: Tuple[str, ...] = ()):
+        super().__init__(f"cauth:reference:{model_label}:version")
+        self.model_label = model_label  # resolved lazily, so models.py can use the cache too
+        self.key = key
+        self.select_related = select_related
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def build(self):
+        by_key: Dict[str, List[T]] = {}
+        by_pk: Dict[int, T] = {}
+        for obj in self.model.objects.select_related(*self.select_related).order_by("pk"):
+            by_key.setdefault(getattr(obj, self.key), []).append(obj)
+            by_pk[obj.pk] = obj
+        return by_key, by_pk
+
+    def _maps(self) -> Tuple[Dict[str, List[T]], Dict[int, T]]:
+        return self.current()[2]
+
+    def get(self, value) -> T:  # same exceptions as objects.get(<key>=value)
+        found = self._maps()[0].get(value, [])
+        if not found:
+            raise self.model.DoesNotExist(f"{self.model.__name__} with {self.key} {value} does not exist")
+        if len(found) > 1:
+            raise self.model.MultipleObjectsReturned(f"More than one {self.model.__name__} with {self.key} {value}")
+        return found[0]
+
+    def get_pk(self, pk) -> T:
+        try:
+            return self._maps()[1][int(pk)]
+        except (KeyError, ValueError, TypeError):
+            raise self.model.DoesNotExist(f"{self.model.__name__} with pk {pk} does not exist")
+
+    def all(self) -> List[T]:
+        return list(self._maps()[1].values())
+
+
+roles = ReferenceCache("cauth.Role", select_related=("extras_content_type",))
+requirement_types = ReferenceCache("cauth.RequirementTypes")
+requirements = ReferenceCache("cauth.Requirements", select_related=("requirement_type",))
+requirement_options = ReferenceCache("cauth.RequirementOptions", key="value")
+skills = ReferenceCache("cauth.Skills")
+skill_tags = ReferenceCache("cauth.SkillTags")
+response_statuses = ReferenceCache("cauth.VacancyResponseStatuses")
+complain_reasons = ReferenceCache("cauth.ComplainReasons")
+
+REFERENCE_CACHES = {cache.model_label: cache for cache in (roles, requirement_types, requirements, requirement_options, skills, skill_tags, response_statuses, complain_reasons)}
+
+
+def catalog_etag(*caches: SharedState):  # conditional GET for endpoints serving only these catalogs and indexes built from them
+    def decorator(get):
+        @wraps(get)
+        def wrapper(self, request, *args, **kwargs):
+            versions = ",".join(f"{cache.version_key}={cache.version()}" for cache in caches)
+            etag = quote_etag(hashlib.sha1(f"{request.get_full_path()}|{versions}".encode()).hexdigest())
+            if etag in parse_etags(request.headers.get("If-None-Match", "")):
+                return Response(status=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            response = get(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                response["ETag"] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,256 @@
+import numpy as np
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+from django.db import transaction
+from .models import vacancy_skills, skills_workers, worker_vacancy_relevance, multiple_requirement_options, vacancy_multiple_options
+from . import reference_cache
+from .skill_index import vacancies_sharing_skills, workers_sharing_skills, select_candidates, vacancy_index, worker_index
+from .skill_similarity import skill_similarity
+
+
+def skill_weights(rows: Iterable[Tuple[int, int]]):  # rows of one vacancy: (skill_id, relevance)
+    rows = list(rows)
+    relevance_count = dict(Counter(relevance for _, relevance in rows))
+    relevance_sum = sum(relevance_count.keys())
+    return {skill_id: ((100/relevance_sum)*relevance)/relevance_count[relevance] for skill_id, relevance in rows}
+
+
+RELEVANCE_MODES = ("exact", "partial", "experience")
+EXPERIENCE_LEVELS = ["Trainee", "Junior", "Middle", "Senior"]
+UNKNOWN_LEVEL = len(EXPERIENCE_LEVELS)  # a missing level on either side keeps the plain weight
+EXPERIENCE_PENALTY = 0.25  # per level the worker is below the asked one
+EXPERIENCE_BONUS = 0.05  # per level above
+
+
+def level_factors() -> np.ndarray:  # [worker level, vacancy level] -> multiplier of the skill weight
+    gap = np.arange(UNKNOWN_LEVEL)[:, None] - np.arange(UNKNOWN_LEVEL)[None, :]
+    factors = np.ones((UNKNOWN_LEVEL + 1, UNKNOWN_LEVEL + 1))
+    factors[:UNKNOWN_LEVEL, :UNKNOWN_LEVEL] = np.where(gap < 0, 1 + EXPERIENCE_PENALTY*gap, 1 + EXPERIENCE_BONUS*gap)
+    return factors
+
+
+LEVEL_FACTORS = level_factors()
+
+
+def level_ordinal(level: str) -> int:
+    return EXPERIENCE_LEVELS.index(level) if level in EXPERIENCE_LEVELS else UNKNOWN_LEVEL
+
+
+class RelevanceMatrix:  # worker x vacancy skill relevance, one query per side and one matrix product for the page
+    def __init__(self, worker_ids: Iterable[int], vacancy_ids: Iterable[int], mode: str = "exact"):
+        self.worker_ids = list(dict.fromkeys(worker_ids))
+        self.vacancy_ids = list(dict.fromkeys(vacancy_ids))
+        self.worker_index = {pk: i for i, pk in enumerate(self.worker_ids)}
+        self.vacancy_index = {pk: i for i, pk in enumerate(self.vacancy_ids)}
+
+        vacancy_rows = defaultdict(list)
+        self.skill_index, self.skill_names = {}, {}
+        levels = []
+        for vacancy_id, skill_id, relevance, skill_name, level in vacancy_skills.objects.filter(vacancy_id__in=self.vacancy_ids).values_list("vacancy_id", "skill_id", "relevance", "skill__name", "experience_level"):
+            vacancy_rows[vacancy_id].append((skill_id, relevance))
+            column = self.skill_index.setdefault(skill_id, len(self.skill_index))
+            self.skill_names[column] = skill_name
+            levels.append((self.vacancy_index[vacancy_id], column, level_ordinal(level)))
+
+        self.vacancy_weights = np.zeros((len(self.vacancy_ids), len(self.skill_index)))
+        for vacancy_id, rows in vacancy_rows.items():
+            row = self.vacancy_weights[self.vacancy_index[vacancy_id]]
+            for skill_id, weight in skill_weights(rows).items():
+                row[self.skill_index[skill_id]] = weight
+        self.vacancy_levels = np.full(self.vacancy_weights.shape, UNKNOWN_LEVEL, dtype=np.int8)
+        for row, column, level in levels:
+            self.vacancy_levels[row, column] = level
+
+        # coverage of every asked skill by each worker: exact rows are counted, partial takes the best tag-similar skill
+        self.coverage = np.zeros((len(self.worker_ids), len(self.skill_index)))
+        self.worker_levels = np.full(self.coverage.shape, UNKNOWN_LEVEL, dtype=np.int8)
+        if self.skill_index and mode == "partial":
+            worker_rows = defaultdict(list)
+            for worker_id, skill_id in skills_workers.objects.filter(worker_id__in=self.worker_ids).values_list("worker_id", "skill_id"):
+                worker_rows[worker_id].append(skill_id)
+            for worker_id, skill_ids in worker_rows.items():
+                self.coverage[self.worker_index[worker_id]] = skill_similarity.credit(skill_ids, self.skill_index).max(axis=0)
+        elif self.skill_index:
+            for worker_id, skill_id, level in skills_workers.objects.filter(worker_id__in=self.worker_ids, skill_id__in=list(self.skill_index)).values_list("worker_id", "skill_id", "experience_level"):
+                row, column = self.worker_index[worker_id], self.skill_index[skill_id]
+                self.coverage[row, column] += 1  # duplicated skill rows are counted like before
+                level = level_ordinal(level)
+                if level != UNKNOWN_LEVEL and (self.worker_levels[row, column] == UNKNOWN_LEVEL or level > self.worker_levels[row, column]):
+                    self.worker_levels[row, column] = level  # the best known level of duplicated rows
+
+        if mode == "experience":  # (workers, vacancies, skills) factors, the only mode paying for the third axis
+            self.factors = LEVEL_FACTORS[self.worker_levels[:, None, :], self.vacancy_levels[None, :, :]]
+            self.scores = np.einsum("ws,wvs,vs->wv", self.coverage, self.factors, self.vacancy_weights)
+        else:
+            self.factors = None
+            self.scores = self.coverage @ self.vacancy_weights.T
+
+    def relevance(self, worker_id: int, vacancy_id: int) -> float:
+        if worker_id not in self.worker_index or vacancy_id not in self.vacancy_index:  # not a candidate, nothing shared
+            return 0
+        return float(self.scores[self.worker_index[worker_id], self.vacancy_index[vacancy_id]])
+
+    def explain(self, worker_id: int, vacancy_id: int) -> dict:
+        if worker_id not in self.worker_index or vacancy_id not in self.vacancy_index:
+            return {}
+        wi, vi = self.worker_index[worker_id], self.vacancy_index[vacancy_id]
+        weights = self.vacancy_weights[vi]
+        coverage = np.minimum(self.coverage[wi], 1)
+        matched = np.flatnonzero(weights * coverage)
+        if self.factors is None:
+            return {self.skill_names[column]: float(weights[column] * coverage[column]) for column in matched}
+        levels = EXPERIENCE_LEVELS + [None]
+        return {self.skill_names[column]: {  # per-skill breakdown of the experience mode
+            "weight": float(weights[column]),
+            "level": levels[self.worker_levels[wi, column]],
+            "required": levels[self.vacancy_levels[vi, column]],
+            "factor": float(self.factors[wi, vi, column]),
+            "relevance": float(weights[column] * self.coverage[wi, column] * self.factors[wi, vi, column]),
+        } for column in matched}
+
+    def annotate(self, data: List[dict], pairs: Iterable[Tuple[int, int]]):  # pairs of (worker_id, vacancy_id) aligned with data
+        for item, (worker_id, vacancy_id) in zip(data, pairs):
+            item["relevance"] = self.relevance(worker_id, vacancy_id)
+            item["explain"] = self.explain(worker_id, vacancy_id)
+        return data
+
+
+class StoredRelevance(RelevanceMatrix):  # same interface, but reads worker_vacancy_relevance instead of computing
+    def __init__(self, worker_ids: Iterable[int], vacancy_ids: Iterable[int]):
+        self.worker_ids = list(dict.fromkeys(worker_ids))
+        self.vacancy_ids = list(dict.fromkeys(vacancy_ids))
+        if not self.worker_ids or not self.vacancy_ids:
+            qs = worker_vacancy_relevance.objects.none()
+        elif len(self.worker_ids) == 1:  # one feed reads its side through the index instead of a long IN list
+            qs = worker_vacancy_relevance.objects.filter(worker_id=self.worker_ids[0])
+        elif len(self.vacancy_ids) == 1:
+            qs = worker_vacancy_relevance.objects.filter(vacancy_id=self.vacancy_ids[0])
+        else:
+            qs = worker_vacancy_relevance.objects.filter(worker_id__in=self.worker_ids, vacancy_id__in=self.vacancy_ids)
+        self.stored = {(w, v): (relevance, explain) for w, v, relevance, explain in qs.values_list("worker_id", "vacancy_id", "relevance", "explain")}
+
+    def relevance(self, worker_id: int, vacancy_id: int) -> float:
+        return self.stored.get((worker_id, vacancy_id), (0, {}))[0]
+
+    def explain(self, worker_id: int, vacancy_id: int) -> dict:
+        return self.stored.get((worker_id, vacancy_id), (0, {}))[1]
+
+
+def store_relevance(matrix: RelevanceMatrix, **scope):  # scope is worker_id= or vacancy_id= whose rows are replaced
+    rows = []
+    for wi, vi in zip(*np.nonzero(matrix.scores)):
+        worker_id, vacancy_id = matrix.worker_ids[wi], matrix.vacancy_ids[vi]
+        rows.append(worker_vacancy_relevance(worker_id=worker_id, vacancy_id=vacancy_id, relevance=float(matrix.scores[wi, vi]), explain=matrix.explain(worker_id, vacancy_id)))
+    with transaction.atomic():
+        worker_vacancy_relevance.objects.filter(**scope).delete()
+        worker_vacancy_relevance.objects.bulk_create(rows)
+
+
+def refresh_worker_relevance(worker_id: int):
+    shared_skills = skills_workers.objects.filter(worker_id=worker_id).values("skill_id")
+    vacancy_ids = vacancy_skills.objects.filter(skill_id__in=shared_skills).values_list("vacancy_id", flat=True).distinct()
+    store_relevance(RelevanceMatrix([worker_id], vacancy_ids), worker_id=worker_id)
+
+
+def refresh_vacancy_relevance(vacancy_id: int):
+    shared_skills = vacancy_skills.objects.filter(vacancy_id=vacancy_id).values("skill_id")
+    worker_ids = skills_workers.objects.filter(skill_id__in=shared_skills).values_list("worker_id", flat=True).distinct()
+    store_relevance(RelevanceMatrix(worker_ids, [vacancy_id]), vacancy_id=vacancy_id)
+
+
+def relevance_for_worker(worker_id: int, vacancy_ids: Iterable[int], mode: str = "exact"):  # scores only vacancies sharing a skill
+    if mode == "partial":
+        candidates = vacancy_index.owners_of(skill_similarity.similar_skills(worker_index.skills_of(worker_id).tolist()))
+    else:
+        candidates = vacancies_sharing_skills(worker_id)
+    vacancy_ids = select_candidates(vacancy_ids, candidates)
+    if mode == "exact":
+        return StoredRelevance([worker_id], vacancy_ids)
+    return RelevanceMatrix([worker_id], vacancy_ids, mode)
+
+
+def relevance_for_vacancy(vacancy_id: int, worker_ids: Iterable[int], mode: str = "exact"):
+    if mode == "partial":
+        candidates = worker_index.owners_of(skill_similarity.similar_skills(vacancy_index.skills_of(vacancy_id).tolist()))
+    else:
+        candidates = workers_sharing_skills(vacancy_id)
+    worker_ids = select_candidates(worker_ids, candidates)
+    if mode == "exact":
+        return StoredRelevance(worker_ids, [vacancy_id])
+    return RelevanceMatrix(worker_ids, [vacancy_id], mode)
+
+
+REQUIREMENT_WEIGHTS = {"Salary": 3, "City": 3, "Education": 2, "Work format": 2, "Working day": 1}  # others weigh 1
+
+
+class RequirementMatrix:  # chosen options of each side as fixed-width bitsets, overlap per requirement with popcount
+    def __init__(self, worker_ids: Iterable[int], vacancy_ids: Iterable[int]):
+        self.worker_ids = list(dict.fromkeys(worker_ids))
+        self.vacancy_ids = list(dict.fromkeys(vacancy_ids))
+        self.worker_index = {pk: i for i, pk in enumerate(self.worker_ids)}
+        self.vacancy_index = {pk: i for i, pk in enumerate(self.vacancy_ids)}
+
+        bits, requirements = {}, {}  # from the per-process catalogs, no query per request
+        requirement_names = {r.pk: r.name for r in reference_cache.requirements.all()}
+        for option in reference_cache.requirement_options.all():
+            bits[option.pk] = len(bits)
+            requirements.setdefault(option.requirement_id, (len(requirements), requirement_names.get(option.requirement_id, ""), []))[2].append(bits[option.pk])
+        words = max(1, -(-len(bits) // 64))
+        self.requirement_names = [name for _, name, _ in requirements.values()]
+        self.weights = np.array([REQUIREMENT_WEIGHTS.get(name, 1) for name in self.requirement_names], dtype=np.float64)
+        self.masks = np.zeros((len(requirements), words), dtype=np.uint64)
+        for index, _, option_bits in requirements.values():
+            self._set_bits(self.masks[index], option_bits)
+
+        self.worker_bits = np.zeros((len(self.worker_ids), words), dtype=np.uint64)
+        for worker_id, option_id in multiple_requirement_options.objects.filter(rw__worker_id__in=self.worker_ids).values_list("rw__worker_id", "option_id"):
+            if option_id in bits:  # an option newer than the cached catalog counts once the catalog is rebuilt
+                self._set_bits(self.worker_bits[self.worker_index[worker_id]], [bits[option_id]])
+        self.vacancy_bits = np.zeros((len(self.vacancy_ids), words), dtype=np.uint64)
+        for vacancy_id, option_id in vacancy_multiple_options.objects.filter(vr__vacancy_id__in=self.vacancy_ids).values_list("vr__vacancy_id", "option_id"):
+            if option_id in bits:
+                self._set_bits(self.vacancy_bits[self.vacancy_index[vacancy_id]], [bits[option_id]])
+
+        # (vacancies, requirements): which requirements a vacancy asks for at all
+        self.asked = np.bitwise_count(self.vacancy_bits[:, None, :] & self.masks[None, :, :]).sum(-1) > 0
+        self.asked_weight = self.asked @ self.weights
+
+    @staticmethod
+    def _set_bits(row, positions):
+        for position in positions:
+            row[position // 64] |= np.uint64(1 << (position % 64))
+
+    def matched(self, worker_rows: np.ndarray, vacancy_rows: np.ndarray) -> np.ndarray:  # (pairs, requirements) with a shared option
+        overlap = self.vacancy_bits[vacancy_rows] & self.worker_bits[worker_rows]
+        return np.bitwise_count(overlap[:, None, :] & self.masks[None, :, :]).sum(-1) > 0
+
+    def annotate(self, data: List[dict], pairs: Iterable[Tuple[int, int]]):  # one vectorized pass over every pair of the page
+        pairs = list(pairs)
+        if not pairs:
+            return data
+        worker_rows = np.array([self.worker_index[w] for w, _ in pairs], dtype=np.int64)
+        vacancy_rows = np.array([self.vacancy_index[v] for _, v in pairs], dtype=np.int64)
+        matched = self.matched(worker_rows, vacancy_rows)
+        asked_weight = self.asked_weight[vacancy_rows]
+        shares = np.divide(100 * self.weights[None, :], asked_weight[:, None], out=np.zeros(matched.shape), where=asked_weight[:, None] > 0)
+        scores = (matched * shares).sum(axis=1)
+        for row, (item, requirements) in enumerate(zip(data, matched)):
+            item["requirement_relevance"] = float(scores[row])
+            item["requirement_explain"] = {self.requirement_names[i]: float(shares[row, i]) for i in np.flatnonzero(requirements)}
+        return data
+
+
+def calculate_relevance(data: List[dict], pairs: List[Tuple[int, int]], mode: str = "exact"):
+    pairs = list(pairs)
+    worker_ids = {w for w, _ in pairs}
+    vacancy_ids = {v for _, v in pairs}
+    if len(worker_ids) == 1:
+        matrix = relevance_for_worker(next(iter(worker_ids)), [v for _, v in pairs], mode)
+    elif len(vacancy_ids) == 1:
+        matrix = relevance_for_vacancy(next(iter(vacancy_ids)), [w for w, _ in pairs], mode)
+    elif mode == "exact":
+        matrix = StoredRelevance(worker_ids, vacancy_ids)
+    else:
+        matrix = RelevanceMatrix(worker_ids, vacancy_ids, mode)
+    matrix.annotate(data, pairs)
+    return RequirementMatrix(worker_ids, vacancy_ids).annotate(data, pairs)
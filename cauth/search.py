@@ -0,0 +1,24 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q, QuerySet, Value
+from django.db.models.functions import Coalesce
+from .models import Vacancy
+
+SEARCH_CONFIG = "simple"  # vacancies are written in several languages, so no stemming dictionary
+VACANCY_VECTOR = SearchVector("title", weight="A", config=SEARCH_CONFIG) + SearchVector(Coalesce("description", Value("")), weight="B", config=SEARCH_CONFIG)
+
+
+def full_text_enabled() -> bool:
+    return connection.vendor == "postgresql"
+
+
+def update_search_vectors(queryset: QuerySet = None):  # one UPDATE, the vector is computed by the database
+    if full_text_enabled():
+        (Vacancy.objects.all() if queryset is None else queryset).update(search_vector=VACANCY_VECTOR)
+
+
+def search_vacancies(queryset: QuerySet, q: str) -> QuerySet:  # ranked matches, title hits above description hits
+    if not full_text_enabled():  # other backends can't use the GIN index, plain substring match
+        return queryset.filter(Q(title__icontains=q) | Q(description__icontains=q))
+    query = SearchQuery(q, search_type="websearch", config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(rank=SearchRank(F("search_vector"), query)).order_by("-rank", "pk")
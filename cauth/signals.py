@@ -1,9 +1,164 @@
+from functools import partial
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed, post_migrate
 from django.dispatch import receiver
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
+from .models import Skills, Requirements, RequirementOptions, RequirementTypes, skills_workers, vacancy_skills, skills_tags, requirement_workers, vacancy_requirements, multiple_requirement_options, vacancy_multiple_options, WorkerExtras, Vacancy
+from .relevance import refresh_worker_relevance, refresh_vacancy_relevance
+from .skill_index import vacancy_index, worker_index
+from .skill_similarity import skill_similarity
+from .search import update_search_vectors
+from . import reference_cache
+from .reference_cache import REFERENCE_CACHES
+from .redis_client import SharedState
+from .authentication import token_cache
+from .autocomplete import skills_autocomplete, requirements_autocomplete, options_autocomplete
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
\ No newline at end of file
+        Token.objects.create(user=instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):  # cached copies of the user are stale, e.g. is_active changed
+    revoke_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    token_cache.revoke(instance.key)
+    transaction.on_commit(lambda: token_cache.revoke(instance.key))
+    revoke_user(instance.user_id)  # the epoch bump reaches the LRU of every other process
+
+
+def revoke_user(user_pk: int):  # now, and again after commit: a lookup racing the change may cache the old rows under the first bump
+    token_cache.revoke_user(user_pk)
+    transaction.on_commit(lambda: token_cache.revoke_user(user_pk))
+
+
+def invalidate_on_commit(*states: SharedState):  # a version bumped before commit lets other processes cache the old rows under it
+    for state in states:
+        transaction.on_commit(state.invalidate)
+
+
+def touch_matching(model, **lookup):  # marks entities for the next incremental recommendations run
+    model.objects.filter(**lookup).update(matching_updated=timezone.now())
+
+
+def refresh_worker(worker_pk: int):
+    touch_matching(WorkerExtras, pk=worker_pk)
+    refresh_worker_relevance(worker_pk)
+
+
+def refresh_vacancy(vacancy_pk: int):
+    touch_matching(Vacancy, pk=vacancy_pk)
+    refresh_vacancy_relevance(vacancy_pk)
+
+
+def refresh_on_commit(refresh, pk: int):  # once per entity and transaction, however many of its rows changed
+    connection = transaction.get_connection()
+    for _, func, _ in connection.run_on_commit:  # callbacks of rolled back savepoints are already dropped from here
+        if isinstance(func, partial) and func.func is refresh and func.args == (pk,):
+            return
+    transaction.on_commit(partial(refresh, pk))
+
+
+@receiver(post_save, sender=skills_workers)
+@receiver(post_delete, sender=skills_workers)
+def worker_skills_changed(sender, instance, **kwargs):  # after commit, so cascades of a deleted worker are already gone
+    invalidate_on_commit(worker_index)
+    refresh_on_commit(refresh_worker, instance.worker_id)
+
+
+@receiver(post_save, sender=vacancy_skills)
+@receiver(post_delete, sender=vacancy_skills)
+def vacancy_skills_changed(sender, instance, **kwargs):
+    invalidate_on_commit(vacancy_index)
+    refresh_on_commit(refresh_vacancy, instance.vacancy_id)
+
+
+@receiver(post_save, sender=requirement_workers)
+@receiver(post_delete, sender=requirement_workers)
+def worker_requirements_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_matching(WorkerExtras, pk=instance.worker_id))
+
+
+@receiver(post_save, sender=vacancy_requirements)
+@receiver(post_delete, sender=vacancy_requirements)
+def vacancy_requirements_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_matching(Vacancy, pk=instance.vacancy_id))
+
+
+@receiver(post_save, sender=multiple_requirement_options)
+@receiver(post_delete, sender=multiple_requirement_options)
+def worker_options_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_matching(WorkerExtras, related_rw=instance.rw_id))
+
+
+@receiver(post_save, sender=vacancy_multiple_options)
+@receiver(post_delete, sender=vacancy_multiple_options)
+def vacancy_options_changed(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_matching(Vacancy, related_vr=instance.vr_id))
+
+
+@receiver(m2m_changed, sender=multiple_requirement_options)
+@receiver(m2m_changed, sender=vacancy_multiple_options)
+def options_set_changed(sender, instance, action, reverse, **kwargs):  # .add()/.set() bulk insert the through rows without post_save
+    if reverse or action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if sender is multiple_requirement_options:
+        transaction.on_commit(lambda: touch_matching(WorkerExtras, pk=instance.worker_id))
+    else:
+        transaction.on_commit(lambda: touch_matching(Vacancy, pk=instance.vacancy_id))
+
+
+@receiver(post_save, sender=skills_tags)
+@receiver(post_delete, sender=skills_tags)
+@receiver(m2m_changed, sender=skills_tags)
+def skill_tags_changed(sender, **kwargs):  # partial matching credit depends on shared tags
+    invalidate_on_commit(skill_similarity, reference_cache.skills)  # the skills catalog lists tags
+
+
+@receiver(post_save, sender=Vacancy)
+def vacancy_text_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {"title", "description"} & set(update_fields):
+        update_search_vectors(Vacancy.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Skills)
+@receiver(post_delete, sender=Skills)
+def skills_catalog_changed(sender, **kwargs):
+    invalidate_on_commit(skills_autocomplete)
+
+
+@receiver(post_save, sender=Requirements)
+@receiver(post_delete, sender=Requirements)
+@receiver(post_save, sender=RequirementTypes)  # requirements are grouped by type name
+@receiver(post_delete, sender=RequirementTypes)
+def requirements_catalog_changed(sender, **kwargs):
+    invalidate_on_commit(requirements_autocomplete)
+
+
+@receiver(post_save, sender=RequirementOptions)
+@receiver(post_delete, sender=RequirementOptions)
+def options_catalog_changed(sender, **kwargs):
+    invalidate_on_commit(options_autocomplete)
+
+
+def reference_data_changed(sender, **kwargs):
+    invalidate_on_commit(REFERENCE_CACHES[sender._meta.label])
+
+
+for label in REFERENCE_CACHES:
+    post_save.connect(reference_data_changed, sender=label, dispatch_uid=f"reference_cache_save_{label}")
+    post_delete.connect(reference_data_changed, sender=label, dispatch_uid=f"reference_cache_delete_{label}")
+
+
+@receiver(post_migrate)
+def reference_data_migrated(sender, **kwargs):  # also sent after flush, when the tables were emptied without signals
+    for cache in REFERENCE_CACHES.values():
+        cache.invalidate()
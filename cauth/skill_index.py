@@ -0,0 +1,52 @@
+import numpy as np
+from collections import defaultdict
+from typing import Iterable
+from .models import vacancy_skills, skills_workers
+from .redis_client import SharedState
+
+EMPTY = np.array([], dtype=np.int64)
+
+
+class SkillIndex(SharedState):  # skill_id -> sorted owner ids and owner id -> sorted skill ids, loaded lazily and rebuilt after writes
+    def __init__(self, model, owner_field: str):
+        super().__init__(f"cauth:skill_index:{model._meta.label}:version")
+        self.model = model
+        self.owner_field = owner_field
+
+    def build(self):
+        by_skill, by_owner = defaultdict(list), defaultdict(list)
+        for skill_id, owner_id in self.model.objects.values_list("skill_id", self.owner_field):
+            by_skill[skill_id].append(owner_id)
+            by_owner[owner_id].append(skill_id)
+        return ({k: np.unique(np.array(v, dtype=np.int64)) for k, v in by_skill.items()},
+                {k: np.unique(np.array(v, dtype=np.int64)) for k, v in by_owner.items()})
+
+    def _postings(self):
+        return self.current()[2]
+
+    def skills_of(self, owner_id: int) -> np.ndarray:
+        return self._postings()[1].get(owner_id, EMPTY)
+
+    def owners_of(self, skill_ids: Iterable[int]) -> np.ndarray:  # sorted union of owners having any of the skills
+        by_skill = self._postings()[0]
+        postings = [by_skill[i] for i in skill_ids if i in by_skill]
+        if not postings:
+            return EMPTY
+        return np.unique(np.concatenate(postings))
+
+
+vacancy_index = SkillIndex(vacancy_skills, "vacancy_id")
+worker_index = SkillIndex(skills_workers, "worker_id")
+
+
+def vacancies_sharing_skills(worker_id: int) -> np.ndarray:
+    return vacancy_index.owners_of(worker_index.skills_of(worker_id))
+
+
+def workers_sharing_skills(vacancy_id: int) -> np.ndarray:
+    return worker_index.owners_of(vacancy_index.skills_of(vacancy_id))
+
+
+def select_candidates(ids: Iterable[int], candidates: np.ndarray) -> list:  # keeps the order of ids
+    ids = np.fromiter(ids, dtype=np.int64)
+    return ids[np.isin(ids, candidates)].tolist()
@@ -0,0 +1,51 @@
+import numpy as np
+from typing import Iterable, List
+from .models import skills_tags
+from .redis_client import SharedState
+
+PARTIAL_CREDIT = 0.5  # a skill sharing all tags with the asked one counts for half of an exact match
+
+
+class SkillSimilarity(SharedState):  # skill x skill Jaccard similarity over shared tags, built lazily and rebuilt when skills_tags changes
+    def __init__(self):
+        super().__init__("cauth:skill_similarity:version")
+
+    def build(self):
+        rows = list(skills_tags.objects.values_list("skill_id", "tag_id"))
+        skill_index, tag_index = {}, {}
+        for skill_id, tag_id in rows:
+            skill_index.setdefault(skill_id, len(skill_index))
+            tag_index.setdefault(tag_id, len(tag_index))
+        tags = np.zeros((len(skill_index), len(tag_index)))
+        for skill_id, tag_id in rows:
+            tags[skill_index[skill_id], tag_index[tag_id]] = 1
+        shared = tags @ tags.T
+        sizes = np.diag(shared)
+        union = sizes[:, None] + sizes[None, :] - shared
+        similarity = np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+        return skill_index, similarity
+
+    def _matrix(self):
+        return self.current()[2]
+
+    def credit(self, have: Iterable[int], asked: Iterable[int]) -> np.ndarray:  # (have, asked): 1 for the same skill, partial credit for similar ones
+        have, asked = list(have), list(asked)
+        skill_index, similarity = self._matrix()
+        credit = np.zeros((len(have), len(asked)))
+        have_rows = [(i, skill_index[s]) for i, s in enumerate(have) if s in skill_index]
+        asked_rows = [(j, skill_index[s]) for j, s in enumerate(asked) if s in skill_index]
+        if have_rows and asked_rows:
+            credit[np.ix_([i for i, _ in have_rows], [j for j, _ in asked_rows])] = PARTIAL_CREDIT * similarity[np.ix_([k for _, k in have_rows], [k for _, k in asked_rows])]
+        credit[np.array(have)[:, None] == np.array(asked)[None, :]] = 1
+        return credit
+
+    def similar_skills(self, skill_ids: Iterable[int]) -> List[int]:  # the skills themselves and every skill sharing a tag with them
+        skill_index, similarity = self._matrix()
+        skill_ids = list(skill_ids)
+        rows = [skill_index[s] for s in skill_ids if s in skill_index]
+        ids = np.array(list(skill_index), dtype=np.int64)
+        similar = ids[(similarity[rows] > 0).any(axis=0)] if rows else ids[:0]
+        return sorted(set(skill_ids) | set(similar.tolist()))
+
+
+skill_similarity = SkillSimilarity()
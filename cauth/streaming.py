@@ -0,0 +1,58 @@
+import json
+from itertools import islice
+from typing import Callable, Iterator, List, Optional
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+EXPORT_CHUNK_SIZE = 500
+
+
+class NDJSONRenderer(BaseRenderer):  # lets ?format=ndjson through content negotiation, errors are rendered as one line
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        rows = data if isinstance(data, list) else [data]
+        return "".join(json.dumps(i, cls=DjangoJSONEncoder) + "\n" for i in rows).encode()
+
+
+class NDJSONMixin:
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
+    def wants_ndjson(self, request) -> bool:  # ?format=ndjson, Accept header or format in the body of the list posts
+        return request.accepted_renderer.format == "ndjson" or request.data.get("format", None) == "ndjson"
+
+
+def ndjson_rows(queryset: QuerySet, serialize: Callable[[list], List[dict]], score: Optional[Callable[[List[dict], list], None]] = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    # one server-side chunk in memory at a time, scored as a batch before its lines are written
+    rows = queryset.iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        data = serialize(chunk)
+        if score is not None:
+            score(data, chunk)
+        for item in data:
+            yield json.dumps(item, cls=DjangoJSONEncoder) + "\n"
+
+
+async def ndjson_stream(lines: Iterator[str], chunk_size: int = EXPORT_CHUNK_SIZE):
+    # ASGI consumes sync iterators with list() before sending anything, so chunks are produced one at a time in the sync thread
+    try:
+        while chunk := await sync_to_async(lambda: list(islice(lines, chunk_size)))():
+            yield "".join(chunk)
+    finally:
+        await sync_to_async(lines.close)()  # the client may disconnect before the end, the cursor goes with it
+
+
+def ndjson_response(request, queryset: QuerySet, serialize: Callable[[list], List[dict]], score: Optional[Callable[[List[dict], list], None]] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> StreamingHttpResponse:
+    lines = ndjson_rows(queryset, serialize, score, chunk_size)
+    if isinstance(getattr(request, "_request", request), ASGIRequest):  # daphne, WSGI servers and the test client stream sync iterators
+        lines = ndjson_stream(lines, chunk_size)
+    return StreamingHttpResponse(lines, content_type=NDJSONRenderer.media_type)
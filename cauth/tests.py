@@ -1,7 +1,20 @@
 from django.test import TestCase, TransactionTestCase, Client
-from .models import Role, User, WorkerExtras, HRExtras, users_roles, RequirementTypes, Requirements, RequirementOptions, Companies, ComplainReasons, Complains, Skills, SkillTags, Vacancy, requirement_workers, vacancy_requirements, skills_workers, fill_db, VacancyResponseStatuses, vacancy_responses, VacancyQuickResponses
+from .models import Role, User, WorkerExtras, HRExtras, users_roles, RequirementTypes, Requirements, RequirementOptions, Companies, ComplainReasons, Complains, Skills, SkillTags, Vacancy, requirement_workers, vacancy_requirements, skills_workers, fill_db, VacancyResponseStatuses, vacancy_responses, VacancyQuickResponses, worker_vacancy_relevance, RecommendationGenerations, recommended_vacancies, recommended_workers
 from django.db.utils import IntegrityError
+from django.db import transaction, connection
+from unittest import skipUnless
+from django.core.management import call_command
+from io import StringIO
+import json
+from functools import partial
+from asgiref.sync import async_to_sync
 from rest_framework.authtoken.models import Token
+from .skill_index import vacancies_sharing_skills, workers_sharing_skills
+from . import reference_cache
+from .pagination import encode_cursor
+from .relevance import RequirementMatrix
+from .authentication import authenticate_token, dump_token, load_token, token_cache
+from rest_framework.exceptions import AuthenticationFailed
 
 
 #testing aviability of data in db
@@ -31,6 +44,21 @@ class UserTestCase(TransactionTestCase):  # transaction test case because genera
         with self.assertRaises(ValueError):  # attempt to get not bound role extras
             u.get_extras_for_role("Worker")
     
+    def test_role_memo(self):
+        u = User.objects.get(username="u1")
+        u.add_role("HR")
+        u.add_role("Moderator")
+        with self.assertNumQueries(1):  # roles and extras joined once, then memoized on the instance
+            self.assertEqual(u.get_extras_for_role("HR").__class__, HRExtras)
+            u.get_extras_for_role("HR")
+            self.assertTrue(u.has_role("Moderator"))
+            self.assertFalse(u.has_role("Worker"))
+            self.assertEqual(u.get_related_extras(), {"HR": u.get_extras_for_role("HR").pk, "Moderator": 1})
+        u.add_role("Worker")
+        self.assertTrue(u.has_role("Worker"))  # memo is reset by changes through the user
+        u.delete_role("Worker")
+        self.assertFalse(u.has_role("Worker"))
+    
     def test_role_deletion(self):
         u = User.objects.get(username="u1")
         u.add_role("HR")
@@ -155,6 +183,53 @@ class AuthTestCase(TransactionTestCase):
         res = self.client.post("/api/v1/auth/", data={"username": "u1", "password": "Aa111111"})
         self.assertEqual(res.json()["token"], stored_token)  # testing token, returned from the view
 
+    def test_cached_token_authentication(self):
+        u = User.objects.create(username="u1")
+        key = Token.objects.get(user=u).key
+        self.assertEqual(authenticate_token(key)[0].pk, u.pk)
+        with self.assertNumQueries(0):  # served from the token cache
+            user, _ = authenticate_token(key)
+        self.assertIsNot(user, authenticate_token(key)[0])  # every caller gets its own copy
+        res = self.client.get("/api/v1/profile/whoami", headers={"Authorization": f"Token {key}"})
+        self.assertEqual(res.status_code, 200)
+        u.is_active = False
+        u.save()  # revokes cached copies of the user
+        with self.assertRaises(AuthenticationFailed):
+            authenticate_token(key)
+        u.delete()
+        res = self.client.get("/api/v1/profile/whoami", headers={"Authorization": f"Token {key}"})
+        self.assertEqual(res.status_code, 401)
+
+    def test_shared_token_payload(self):
+        u = User.objects.create(username="u1", email="u1@example.com")
+        token = Token.objects.select_related("user").get(user=u)
+        raw = dump_token(token, 123.0, 4)
+        json.loads(raw)  # plain JSON in the shared Redis, nothing is unpickled
+        with self.assertNumQueries(0):
+            expires, epoch, loaded = load_token(raw)
+        self.assertEqual((expires, epoch, loaded.key, loaded.user.pk, loaded.user.username), (123.0, 4, token.key, u.pk, "u1"))
+        self.assertFalse(loaded.user._state.adding)  # saved as an update, not an insert
+        User.objects.create(username="u2")
+        u2_key = Token.objects.get(user__username="u2").key
+        authenticate_token(u2_key)
+        Token.objects.get(key=u2_key).delete()
+        with self.assertRaises(AuthenticationFailed):
+            authenticate_token(u2_key)
+
+    def test_token_cache_revocation_race(self):
+        u = User.objects.create(username="u1")
+        token = Token.objects.select_related("user").get(user=u)
+        epoch = token_cache.epoch(u.pk)
+        token_cache.revoke_user(u.pk)  # the user changed while the token was loading
+        token_cache.set(token.key, token, epoch)
+        self.assertIsNone(token_cache.get(token.key))
+        epoch = token_cache.epoch(u.pk)
+        with transaction.atomic():
+            u.is_active = False
+            u.save()
+            self.assertEqual(token_cache.epoch(u.pk), epoch + 1)
+        self.assertEqual(token_cache.epoch(u.pk), epoch + 2)  # bumped again once the change is visible
+
     def test_register_view(self):
         res = self.client.post("/api/v1/auth/register/", data={"username": "u1", "password": "qwe"})
         self.assertEqual(res.status_code, 201)
@@ -392,6 +467,254 @@ class VacancyViewsTestCase(TransactionTestCase):
         r = self.client.post(f"/api/v1/vacancies/list/", {"requirements": [req2.pk], "options": [o2_2.pk]})  # 6h
         self.assertEqual(r.json().__len__(), 1)
 
+    def test_list_relevance(self):
+        worker_user = User.objects.create(username="worker1")
+        worker_extras = worker_user.add_role("Worker")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        worker_extras.add_skill("Django")
+        worker_extras.add_skill("React")
+        v1 = self.extras.create_vacancy("title1")
+        v1.add_skill("Django")
+        v1.add_skill("React")
+        v1.add_skill("Docker")
+        django_skill = v1.get_skills().get(skill__name="Django")
+        django_skill.relevance = 2
+        django_skill.save()  # goes through the signal, so stored relevance is refreshed
+        v2 = self.extras.create_vacancy("title2")
+        v2.add_skill("Vue")
+        v3 = self.extras.create_vacancy("title3")
+        Vacancy.objects.update(visible=True)
+
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1}, headers={"Authorization": worker_token})
+        data = {i["pk"]: i for i in res.json()}
+        self.assertAlmostEqual(data[v1.pk]["relevance"], 100/3*2 + 100/3/2)  # relevance 2 weighs twice as much as two shared relevance 1
+        self.assertAlmostEqual(data[v1.pk]["explain"]["React"], 100/3/2)
+        self.assertNotIn("Docker", data[v1.pk]["explain"])
+        self.assertEqual(data[v2.pk]["relevance"], 0)
+        self.assertEqual(data[v3.pk]["explain"], {})
+
+        res = self.client.post("/api/v1/workers/list/", {"vacancy": v1.pk})
+        self.assertAlmostEqual(res.json()[0]["relevance"], data[v1.pk]["relevance"])  # same engine from the other side
+
+    def test_list_relevance_order(self):
+        worker_user = User.objects.create(username="worker1")
+        worker_extras = worker_user.add_role("Worker")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        worker_extras.add_skill("Django")
+        v1 = self.extras.create_vacancy("title1")
+        v1.add_skill("React")
+        v2 = self.extras.create_vacancy("title2")
+        v2.add_skill("Django")
+        v3 = self.extras.create_vacancy("title3")
+        v3.add_skill("Django")
+        v3.add_skill("React")
+        Vacancy.objects.update(visible=True)
+
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "order": "relevance", "limit": 2}, headers={"Authorization": worker_token})
+        self.assertEqual([i["pk"] for i in res.json()["results"]], [v2.pk, v3.pk])  # best matches first
+        self.assertIsNotNone(res.json()["next"])
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "order": "relevance", "limit": 2, "cursor": res.json()["next"]}, headers={"Authorization": worker_token})
+        self.assertEqual([i["pk"] for i in res.json()["results"]], [v1.pk])  # continuation page
+        self.assertIsNone(res.json()["next"])
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "order": "relevance", "cursor": "baboon"}, headers={"Authorization": worker_token})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post("/api/v1/workers/list/", {"order": "relevance"})
+        self.assertEqual(res.status_code, 400)  # nothing to rank against
+
+    def test_stored_relevance(self):
+        vacancy = self.extras.create_vacancy("title1")
+        vacancy.add_skill("Django")
+        vacancy.add_skill("React")
+        workers = []
+        for name, skills in [("worker1", ["React"]), ("worker2", ["Django", "React"]), ("worker3", ["Vue"])]:
+            extras = User.objects.create(username=name).add_role("Worker")
+            for skill in skills:
+                extras.add_skill(skill)
+            extras.respond_to_vacancy(vacancy)
+            workers.append(extras)
+        self.assertEqual(worker_vacancy_relevance.objects.get(worker=workers[1], vacancy=vacancy).relevance, 100)  # filled on skill creation
+        self.assertFalse(worker_vacancy_relevance.objects.filter(worker=workers[2]).exists())  # zero scores are not stored
+
+        res = self.client.get(f"/api/v1/vacancies/responses/{vacancy.pk}", headers={"Authorization": self.token})
+        self.assertEqual([i["worker"]["pk"] for i in res.json()], [workers[1].pk, workers[0].pk, workers[2].pk])  # ordered by stored relevance
+        self.assertEqual(res.json()[1]["explain"], {"React": 50})
+
+        vacancy.delete_skill("Django")
+        self.assertEqual(worker_vacancy_relevance.objects.get(worker=workers[0], vacancy=vacancy).relevance, 100)  # vacancy weights are recomputed
+        workers[0].delete_skill("React")
+        self.assertFalse(worker_vacancy_relevance.objects.filter(worker=workers[0]).exists())
+        with transaction.atomic():
+            workers[2].add_skill("Django")
+            workers[2].add_skill("React")
+            self.assertEqual(sum(isinstance(func, partial) for _, func, _ in transaction.get_connection().run_on_commit), 1)  # one refresh per worker
+        self.assertEqual(worker_vacancy_relevance.objects.get(worker=workers[2], vacancy=vacancy).relevance, 100)
+
+    def test_requirement_relevance(self):
+        city = Requirements.objects.get(name="City")
+        salary = Requirements.objects.get(name="Salary")
+        work_format = Requirements.objects.get(name="Work format")
+        worker_user = User.objects.create(username="worker1")
+        worker = worker_user.add_role("Worker")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        worker.add_requirement(city, options=[RequirementOptions.objects.get(value="Kyiv")])
+        worker.add_requirement(work_format, options=[RequirementOptions.objects.get(value="Remote")])
+        v1 = self.extras.create_vacancy("title1")
+        v1.add_requirement(city, options=[RequirementOptions.objects.get(value="Kyiv")])
+        v1.add_requirement(salary, options=[RequirementOptions.objects.get(value="30000₴+")])
+        v1.add_requirement(work_format, options=list(work_format.get_options()))
+        v2 = self.extras.create_vacancy("title2")
+        v2.add_requirement(city, options=[RequirementOptions.objects.get(value="Lviv")])
+        v3 = self.extras.create_vacancy("title3")
+        Vacancy.objects.update(visible=True)
+
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1}, headers={"Authorization": worker_token})
+        data = {i["pk"]: i for i in res.json()}
+        self.assertEqual(data[v1.pk]["requirement_relevance"], 100*(3+2)/(3+3+2))  # city and work format matched, salary not
+        self.assertEqual(data[v1.pk]["requirement_explain"], {"City": 100*3/8, "Work format": 100*2/8})
+        self.assertEqual(data[v2.pk]["requirement_relevance"], 0)  # different city
+        self.assertEqual(data[v3.pk]["requirement_relevance"], 0)  # nothing asked
+        res = self.client.post("/api/v1/workers/list/", {"vacancy": v1.pk})
+        self.assertEqual(res.json()[0]["requirement_relevance"], 62.5)
+        RequirementMatrix([worker.pk], [v1.pk])
+        with self.assertNumQueries(2):  # the chosen options of each side, the option catalog comes from the reference cache
+            RequirementMatrix([worker.pk], [v1.pk])
+
+    def test_skill_index(self):
+        worker = User.objects.create(username="worker1").add_role("Worker")
+        worker.add_skill("Django")
+        v1 = self.extras.create_vacancy("title1")
+        v1.add_skill("Django")
+        v2 = self.extras.create_vacancy("title2")
+        v2.add_skill("Vue")
+        self.assertEqual(vacancies_sharing_skills(worker.pk).tolist(), [v1.pk])
+        self.assertEqual(workers_sharing_skills(v2.pk).tolist(), [])
+        with self.assertNumQueries(0):  # loaded once, served from memory afterwards
+            vacancies_sharing_skills(worker.pk)
+        v2.add_skill("Django")  # invalidates the index
+        self.assertEqual(vacancies_sharing_skills(worker.pk).tolist(), [v1.pk, v2.pk])
+        self.assertEqual(workers_sharing_skills(v2.pk).tolist(), [worker.pk])
+
+    def test_list_keyset(self):
+        vacancies = [self.extras.create_vacancy(f"title{i}") for i in range(5)]
+        Vacancy.objects.update(visible=True)
+        res = self.client.post("/api/v1/vacancies/list/", {"limit": 2})
+        self.assertEqual([i["pk"] for i in res.json()["results"]], [v.pk for v in vacancies[:2]])
+        seen = [i["pk"] for i in res.json()["results"]]
+        while res.json()["next"]:
+            res = self.client.post("/api/v1/vacancies/list/", {"limit": 2, "cursor": res.json()["next"]})
+            seen += [i["pk"] for i in res.json()["results"]]
+        self.assertEqual(seen, [v.pk for v in vacancies])  # every row exactly once
+        res = self.client.post("/api/v1/vacancies/list/", {"limit": 3, "sort": "-title"})
+        self.assertEqual([i["title"] for i in res.json()["results"]], ["title4", "title3", "title2"])
+        res = self.client.post("/api/v1/vacancies/list/", {"limit": 3, "sort": "title", "cursor": res.json()["next"]})
+        self.assertEqual(res.status_code, 400)  # cursor of another ordering
+        res = self.client.post("/api/v1/vacancies/list/", {"limit": 3, "sort": "hr"})
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post("/api/v1/vacancies/list/", {"limit": 3, "sort": 5}, content_type="application/json")
+        self.assertEqual(res.status_code, 400)  # not a string
+        for values in (["pk", [1], 1], ["pk", "abc", 1], ["pk", 1, {"pk": 1}]):
+            res = self.client.post("/api/v1/vacancies/list/", {"limit": 3, "cursor": encode_cursor(values)}, content_type="application/json")
+            self.assertEqual(res.status_code, 400)
+
+    def test_list_ndjson(self):
+        worker_user = User.objects.create(username="worker1")
+        worker_extras = worker_user.add_role("Worker")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        worker_extras.add_skill("Django")
+        vacancies = [self.extras.create_vacancy(f"title{i}") for i in range(3)]
+        vacancies[1].add_skill("Django")
+        Vacancy.objects.update(visible=True)
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "format": "ndjson"}, headers={"Authorization": worker_token})
+        self.assertEqual(res["Content-Type"], "application/x-ndjson")
+        rows = [json.loads(i) for i in b"".join(res.streaming_content).decode().splitlines()]
+        self.assertEqual([i["pk"] for i in rows], [v.pk for v in vacancies])
+        self.assertEqual([i["relevance"] for i in rows], [0, 100, 0])  # scored while streaming
+
+        self.client.post(f"/api/v1/vacancies/responses/{vacancies[1].pk}", {}, headers={"Authorization": worker_token})
+        res = self.client.get(f"/api/v1/vacancies/responses/{vacancies[1].pk}?format=ndjson", headers={"Authorization": self.token})
+        rows = [json.loads(i) for i in b"".join(res.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["relevance"], 100)
+
+    def test_list_ndjson_asgi(self):
+        worker_user = User.objects.create(username="worker1")
+        worker_user.add_role("Worker").add_skill("Django")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        vacancies = [self.extras.create_vacancy(f"title{i}") for i in range(3)]
+        vacancies[2].add_skill("Django")
+        Vacancy.objects.update(visible=True)
+
+        async def export():  # through the ASGI handler daphne uses, the body arrives as an async stream
+            res = await self.async_client.post("/api/v1/vacancies/list/", {"worker": 1, "format": "ndjson"}, headers={"Authorization": worker_token})
+            self.assertTrue(res.is_async)
+            return [json.loads(line) async for chunk in res.streaming_content for line in chunk.decode().splitlines()]
+        rows = async_to_sync(export)()
+        self.assertEqual([(i["pk"], i["relevance"]) for i in rows], [(vacancies[0].pk, 0), (vacancies[1].pk, 0), (vacancies[2].pk, 100)])
+
+    def test_list_search(self):
+        v1 = self.extras.create_vacancy("Backend developer")
+        v2 = self.extras.create_vacancy("Designer")
+        v2.description = "Work with backend developers"
+        v2.save()
+        self.extras.create_vacancy("Manager")
+        v1.add_skill("Django")
+        Vacancy.objects.update(visible=True)
+        res = self.client.post("/api/v1/vacancies/list/", {"q": "backend"})
+        self.assertEqual(sorted(i["pk"] for i in res.json()), [v1.pk, v2.pk])  # title and description matches, the order is left to the backend
+        res = self.client.post("/api/v1/vacancies/list/", {"q": "backend", "skills": [Skills.objects.get(name="Django").pk]})
+        self.assertEqual([i["pk"] for i in res.json()], [v1.pk])  # combined with the other filters
+
+    @skipUnless(connection.vendor == "postgresql", "ranked by full text search")
+    def test_list_search_rank(self):
+        v1 = self.extras.create_vacancy("Designer")  # created first, so pk order is the opposite of the rank order
+        v1.description = "Work with backend developers"
+        v1.save()
+        v2 = self.extras.create_vacancy("Backend developer")
+        Vacancy.objects.update(visible=True)
+        res = self.client.post("/api/v1/vacancies/list/", {"q": "backend"})
+        self.assertEqual([i["pk"] for i in res.json()], [v2.pk, v1.pk])  # title match ranks above description match
+
+    def test_partial_relevance(self):
+        worker_user = User.objects.create(username="worker1")
+        worker_extras = worker_user.add_role("Worker")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        worker_extras.add_skill("Vue")
+        v1 = self.extras.create_vacancy("title1")
+        v1.add_skill("React")
+        v1.add_skill("Docker")
+        Vacancy.objects.update(visible=True)
+
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1}, headers={"Authorization": worker_token})
+        self.assertEqual(res.json()[0]["relevance"], 0)  # exact mode by default
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "mode": "partial"}, headers={"Authorization": worker_token})
+        self.assertAlmostEqual(res.json()[0]["relevance"], 50/2)  # Vue shares every tag with React, half of its weight
+        self.assertEqual(res.json()[0]["explain"], {"React": 50/2})
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "mode": "partial", "order": "relevance"}, headers={"Authorization": worker_token})
+        self.assertEqual([i["pk"] for i in res.json()["results"]], [v1.pk])  # similar skills make it a candidate
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "mode": "baboon"}, headers={"Authorization": worker_token})
+        self.assertEqual(res.status_code, 400)
+
+    def test_experience_relevance(self):
+        worker_user = User.objects.create(username="worker1")
+        worker_extras = worker_user.add_role("Worker")
+        worker_token = f"Token {Token.objects.get(user=worker_user).key}"
+        worker_extras.add_skill("Django", experience_level="Junior")
+        worker_extras.add_skill("React", experience_level="Senior")
+        worker_extras.add_skill("Docker")
+        v1 = self.extras.create_vacancy("title1")
+        v1.add_skill("Django", experience_level="Middle")
+        v1.add_skill("React", experience_level="Middle")
+        v1.add_skill("Docker", experience_level="Senior")
+        Vacancy.objects.update(visible=True)
+
+        res = self.client.post("/api/v1/vacancies/list/", {"worker": 1, "mode": "experience"}, headers={"Authorization": worker_token})
+        explain = res.json()[0]["explain"]
+        self.assertAlmostEqual(explain["Django"]["relevance"], 100/3*0.75)  # one level below
+        self.assertAlmostEqual(explain["React"]["relevance"], 100/3*1.05)  # one level above
+        self.assertEqual(explain["Docker"]["factor"], 1)  # unknown worker level is not penalized
+        self.assertEqual((explain["Django"]["level"], explain["Django"]["required"]), ("Junior", "Middle"))
+        self.assertAlmostEqual(res.json()[0]["relevance"], 100/3*(0.75 + 1.05 + 1))
+
     def test_vacancy_response(self):
         worker_user = User.objects.create(username="worker1")
         worker_user.add_role("Worker")
@@ -453,6 +776,46 @@ class OtherViewsTestCase(TransactionTestCase):
         res = self.client.get(f"/api/v1/requirements/options/{requirement.pk}")
         self.assertGreater(len(res.json()), 2)
     
+    def test_autocomplete(self):
+        res = self.client.get("/api/v1/skills/list/git")
+        self.assertEqual([i["name"] for i in res.json()][:3], ["Git", "GitHub", "GitLab"])  # exact and shorter names first
+        Skills.objects.create(name="Legacy git")  # refreshes the index
+        res = self.client.get("/api/v1/skills/list/git")
+        self.assertEqual(res.json()[-1]["name"], "Legacy git")  # inner word matches after name starts
+        res = self.client.get("/api/v1/requirements/list/Vacancy/day")
+        self.assertEqual([i["name"] for i in res.json()], ["Working day"])
+        requirement = Requirements.objects.get(name="Working day")
+        option = requirement.get_options().first()
+        res = self.client.get(f"/api/v1/requirements/options/{requirement.pk}/{option.value[:2]}")
+        self.assertIn(option.pk, [i["pk"] for i in res.json()])
+
+    def test_reference_cache(self):
+        reference_cache.response_statuses.get("Created")
+        with self.assertNumQueries(0):  # served from the process cache
+            self.assertEqual(reference_cache.response_statuses.get("Created").name, "Created")
+            self.assertEqual(reference_cache.roles.get_pk(reference_cache.roles.get("HR").pk).name, "HR")
+        with self.assertRaises(VacancyResponseStatuses.DoesNotExist):
+            reference_cache.response_statuses.get("Baboon")
+        VacancyResponseStatuses.objects.create(name="Baboon")  # invalidated by the signal
+        self.assertEqual(reference_cache.response_statuses.get("Baboon").name, "Baboon")
+        version = reference_cache.response_statuses.version()
+        with transaction.atomic():
+            VacancyResponseStatuses.objects.create(name="Gibbon")
+            self.assertEqual(reference_cache.response_statuses.version(), version)  # not before the rows are visible to others
+        self.assertNotEqual(reference_cache.response_statuses.version(), version)
+
+    def test_catalog_etag(self):
+        res = self.client.get("/api/v1/skills/list/")
+        etag = res["ETag"]
+        with self.assertNumQueries(0):  # answered from the catalog version alone
+            res = self.client.get("/api/v1/skills/list/", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertNotEqual(self.client.get("/api/v1/skills/list/dja")["ETag"], etag)  # per url
+        Skills.objects.create(name="Baboon")
+        res = self.client.get("/api/v1/skills/list/", headers={"If-None-Match": etag})
+        self.assertEqual(res.status_code, 200)  # the write bumped the version
+        self.assertNotEqual(res["ETag"], etag)
+
     def test_vacancy_responses(self):
         self.we.respond_to_vacancy(self.vacancy)
         self.assertEqual(self.we.get_vacancy_responses().count(), 1)  # testing storage of created response from worker
@@ -465,3 +828,33 @@ class OtherViewsTestCase(TransactionTestCase):
 
         self.vacancy.delete_quick_response(status="Created", name="name1")
         self.assertEqual([i.response_text for i in self.vacancy.get_quick_responses()], ["text2"])
+
+    def test_rebuild_relevance(self):
+        self.we.add_skill("Django")
+        self.vacancy.add_skill("Django")
+        worker_vacancy_relevance.objects.all().delete()  # e.g. a database from before the table was filled
+        call_command("rebuild_relevance", stdout=StringIO())
+        self.assertEqual(list(worker_vacancy_relevance.objects.values_list("worker_id", "vacancy_id", "relevance")), [(self.we.pk, self.vacancy.pk, 100)])
+
+    def test_recommendations(self):
+        self.we.add_skill("Django")
+        self.vacancy.add_skill("Django")
+        self.vacancy.visible = True
+        self.vacancy.save()
+        v2 = self.hre.create_vacancy(title="vacancy2")
+        v2.visible = True
+        v2.save()
+        call_command("precompute_recommendations", processes=1, stdout=StringIO())
+        self.assertTrue(RecommendationGenerations.objects.get().full)  # first run has no watermark
+        self.assertEqual([i.vacancy_id for i in recommended_vacancies.objects.filter(worker=self.we)], [self.vacancy.pk])
+        self.assertEqual([i.worker_id for i in recommended_workers.objects.filter(vacancy=self.vacancy)], [self.we.pk])
+
+        v2.add_skill("Django")
+        v2.add_skill("React")
+        out = StringIO()
+        call_command("precompute_recommendations", processes=1, stdout=out)
+        self.assertIn("1 workers, 1 vacancies", out.getvalue())  # only v2 changed, plus the worker sharing its skill
+        self.assertEqual([i.vacancy_id for i in recommended_vacancies.objects.filter(worker=self.we)], [self.vacancy.pk, v2.pk])  # 100 before 50
+        token = f"Token {Token.objects.get(user=self.w).key}"
+        res = self.client.get("/api/v1/vacancies/recommended/", headers={"Authorization": token})
+        self.assertEqual([i["relevance"] for i in res.json()], [100, 50])
@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework.authtoken.views import obtain_auth_token
-from .views import Register, OccupiedUsernames, ProfileView, ProfileExtrasAPIView, VacancyAPIView, WorkerRequirementsAPIVIew, VacancyRequirementsAPIView, WorkerSkillsAPIView, VacancySkillsAPIView, RequirementsListAPIView, SkillsListAPIView, RequirementsOptionsAPIView, VacancyListAPIView, VacancyCreationAPIView, WhoamiAPIView, OwnVacanciesAPIView, AddRoleAPIView, WorkerResponsesAPIView, VacancyResponsesAPIView, SavedUsersListAPIView, SavedUsersDeleteAPIView, SavedVacanciesListAPIView, SavedVacanciesDeleteAPIView, WorkerListAPIView, CreateChatAPIView, ComplainAPIView, ComplainDetailsAPIView, ComplainReasonsAPIView, VacancyQuickResponsesListAPIView, VacancyQuickResponsesDetailAPIView, VacancyResponseStatusesListAPIView, ChatQuickResponsesListAPIView, ComplainDeletionAPIView
+from .views import Register, OccupiedUsernames, ProfileView, ProfileExtrasAPIView, VacancyAPIView, WorkerRequirementsAPIVIew, VacancyRequirementsAPIView, WorkerSkillsAPIView, VacancySkillsAPIView, RequirementsListAPIView, SkillsListAPIView, RequirementsOptionsAPIView, VacancyListAPIView, VacancyCreationAPIView, WhoamiAPIView, OwnVacanciesAPIView, AddRoleAPIView, WorkerResponsesAPIView, VacancyResponsesAPIView, SavedUsersListAPIView, SavedUsersDeleteAPIView, SavedVacanciesListAPIView, SavedVacanciesDeleteAPIView, WorkerListAPIView, CreateChatAPIView, ComplainAPIView, ComplainDetailsAPIView, ComplainReasonsAPIView, VacancyQuickResponsesListAPIView, VacancyQuickResponsesDetailAPIView, VacancyResponseStatusesListAPIView, ChatQuickResponsesListAPIView, ComplainDeletionAPIView, RecommendedVacanciesAPIView, RecommendedWorkersAPIView
 
 app_name = "cauth"
 
@@ -24,6 +24,8 @@ urlpatterns = [
     path("vacancies/responses/<int:pk>", VacancyResponsesAPIView.as_view()),  # get post from vacancy
     path("vacancies/saved-vacancies/", SavedVacanciesListAPIView.as_view()),  # get post
     path("vacancies/saved-vacancies/<int:pk>", SavedVacanciesDeleteAPIView.as_view()),  # delete
+    path("vacancies/recommended/", RecommendedVacanciesAPIView.as_view()),  # get, precomputed for the worker
+    path("vacancies/<int:pk>/recommended-workers/", RecommendedWorkersAPIView.as_view()),  # get, precomputed for the vacancy
 
     path("workers/list/", WorkerListAPIView.as_view()),  # post(list) [too much filtering parameters]
 
@@ -38,6 +40,7 @@ urlpatterns = [
     path("requirements/list/<str:group>/<str:part>", RequirementsListAPIView.as_view()),
     path("requirements/list/<str:group>/", RequirementsListAPIView.as_view()),  # no filtering
     path("requirements/options/<str:requirement>", RequirementsOptionsAPIView.as_view()),
+    path("requirements/options/<str:requirement>/<str:part>", RequirementsOptionsAPIView.as_view()),  # with filtr
     path("skills/list/<str:part>", SkillsListAPIView.as_view()),  # with filtr
     path("skills/list/", SkillsListAPIView.as_view()), # no filtering
     path("chat/create/", CreateChatAPIView.as_view()),
@@ -1,15 +1,21 @@
 from rest_framework.views import APIView
-from rest_framework.authentication import TokenAuthentication
+from .authentication import CachedTokenAuthentication
 from rest_framework.response import Response
-from .models import User, Role, WorkerExtras, HRExtras, Vacancy, requirement_workers, vacancy_requirements, skills_workers, vacancy_skills, Requirements, Skills, RequirementOptions, vacancy_responses, VacancyResponseStatuses, vacancy_responses, SavedVacancies, SavedUsers, Complains, ComplainReasons, VacancyQuickResponses
+from .models import User, Role, WorkerExtras, HRExtras, Vacancy, requirement_workers, vacancy_requirements, skills_workers, vacancy_skills, Requirements, Skills, RequirementOptions, vacancy_responses, VacancyResponseStatuses, vacancy_responses, SavedVacancies, SavedUsers, Complains, ComplainReasons, VacancyQuickResponses, recommended_vacancies, recommended_workers
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED, HTTP_200_OK, HTTP_403_FORBIDDEN
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from .serializers import OwnProfileSeriaizer, OtherProfileSeriaizer, WorkerExtrasSerializer, HRExtrasSerializer, FullVacancySerializer, ShortVacancySerializer, RequirementWorkersSerializer, VacancyRequirementsSerializer, SkillsWorkersSerializer, VacancySkillsSerializer, RequirementsSerializer, SkillsSerializer, RequirementOptionsSerializer, FullVacancySerializer, WhoamiProfileSerializer, VacancyResponsesSerializer, SavedVacanciesSerializer, SavedUsersSerializer, SavedVacanciesSerializer, ShortWorkerSerializer, ShortComplainSerializer, ComplainSerializer, ComplainReasonsSerializer, VacancyQuickResponsesSerializer, VacancyResponseStatusesSerializer
 from .filters import VacanciesFilter, WorkerExtrasFilter
-from django.db.models import Q
+from django.db.models import Q, F, FilteredRelation
+from django.db.models.functions import Coalesce
 from chat.models import Chat
 import uuid
-from collections import Counter
+from .relevance import calculate_relevance, relevance_for_worker, relevance_for_vacancy, RequirementMatrix, RELEVANCE_MODES
+from .pagination import get_limit, top_k_page, keyset_page, ranked_page
+from .streaming import NDJSONMixin, ndjson_response
+from . import reference_cache
+from .reference_cache import catalog_etag
+from .autocomplete import skills_autocomplete, requirements_autocomplete, options_autocomplete
 
 
 class Register(APIView):
@@ -43,7 +49,7 @@ class OccupiedUsernames(APIView):
 
 class ProfileView(APIView):
 
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk=-1):  # get profile info(your or others)
@@ -81,7 +87,7 @@ class ProfileView(APIView):
 
 
 class ProfileExtrasAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     extras_serializers_mapping = {WorkerExtras: WorkerExtrasSerializer, HRExtras: HRExtrasSerializer}
@@ -150,7 +156,7 @@ class ProfileExtrasAPIView(APIView):
 
     
 class VacancyAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
 
     def get(self, request, pk):
@@ -188,7 +194,7 @@ class VacancyAPIView(APIView):
 
 
 class VacancyCreationAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
     def post(self, request):
         try:
@@ -204,77 +210,144 @@ class VacancyCreationAPIView(APIView):
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
 
 
-class VacancyListAPIView(APIView):
+class RelevancePageMixin:  # order=relevance: top-K over the filtered ids, only one page gets serialized
+    def relevance_page(self, request, queryset, ids, matrix, pair):
+        try:
+            limit = get_limit(request.data)
+            page_ids, next_cursor = top_k_page(ids, lambda pk: matrix.relevance(*pair(pk)), limit, request.data.get("cursor"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
+        objects = queryset.in_bulk(page_ids)
+        data = self.serializer_class([objects[pk] for pk in page_ids], many=True).data
+        pairs = [pair(pk) for pk in page_ids]
+        matrix.annotate(data, pairs)
+        RequirementMatrix([w for w, _ in pairs], [v for _, v in pairs]).annotate(data, pairs)
+        return Response({"results": data, "next": next_cursor})
+
+    def stored_relevance_page(self, request, queryset, filtered_queryset, counterpart: Q, pair):  # exact mode: the materialized scores are joined and ordered in SQL
+        queryset = queryset.filter(pk__in=filtered_queryset.values("pk")).annotate(
+            stored=FilteredRelation("related_relevance", condition=counterpart),
+            stored_explain=F("stored__explain"),
+        )
+        try:
+            limit = get_limit(request.data)
+            objects, next_cursor = ranked_page(queryset, "stored__relevance", limit, request.data.get("cursor"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
+        data = self.serializer_class(objects, many=True).data
+        for item, obj in zip(data, objects):
+            item["relevance"] = obj.rank
+            item["explain"] = obj.stored_explain or {}
+        pairs = [pair(obj.pk) for obj in objects]
+        RequirementMatrix([w for w, _ in pairs], [v for _, v in pairs]).annotate(data, pairs)
+        return Response({"results": data, "next": next_cursor})
+
+
+class KeysetPageMixin:  # limit/cursor without order=relevance: pages by (sort key, pk) instead of returning every row
+    sort_fields = {"pk": "pk"}
+
+    def keyset_page(self, request, queryset, pair=None, mode="exact"):
+        sort = request.data.get("sort", "pk")
+        field = self.sort_fields.get(sort.lstrip("-")) if isinstance(sort, str) else None
+        if field is None:
+            return Response({"error": f"sort must be one of {', '.join(self.sort_fields)}"}, status=HTTP_400_BAD_REQUEST)
+        try:
+            limit = get_limit(request.data)
+            objects, next_cursor = keyset_page(queryset, "-" + field if sort.startswith("-") else field, limit, request.data.get("cursor"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
+        data = self.serializer_class(objects, many=True).data
+        if pair is not None:
+            data = calculate_relevance(data, [pair(i["pk"]) for i in data], mode)
+        return Response({"results": data, "next": next_cursor})
+
+
+class VacancyListAPIView(RelevancePageMixin, KeysetPageMixin, NDJSONMixin, APIView):
+    serializer_class = ShortVacancySerializer
+    sort_fields = {"pk": "pk", "title": "title"}
+
     def post(self, request):
-        qs = Vacancy.objects.filter(visible=True).select_related("hr").prefetch_related("related_vr").prefetch_related("related_vs")
+        qs = Vacancy.objects.filter(visible=True).select_related("hr").prefetch_related("related_vr")
         filterset = VacanciesFilter(request.data, queryset=qs)
         if filterset.is_valid():
             filtered_queryset = filterset.qs
         else:
             return Response([], status=HTTP_400_BAD_REQUEST)
+        mode = request.data.get("mode", "exact")
+        if mode not in RELEVANCE_MODES:
+            return Response({"error": f"mode must be one of {', '.join(RELEVANCE_MODES)}"}, status=HTTP_400_BAD_REQUEST)
+        if request.data.get("order", None) == "relevance":
+            if not request.data.get("worker", None):
+                return Response({"error": "worker is required for relevance ordering"}, status=HTTP_400_BAD_REQUEST)
+            worker = request.user.get_extras_for_role("Worker")
+            if mode == "exact":
+                return self.stored_relevance_page(request, qs, filtered_queryset, Q(related_relevance__worker=worker.pk), lambda pk: (worker.pk, pk))
+            ids = list(dict.fromkeys(filtered_queryset.values_list("pk", flat=True)))
+            return self.relevance_page(request, qs, ids, relevance_for_worker(worker.pk, ids, mode), lambda pk: (worker.pk, pk))
+        if request.data.get("limit", None) or request.data.get("cursor", None):
+            pair = None
+            if request.data.get("worker", None):
+                worker = request.user.get_extras_for_role("Worker")
+                pair = lambda pk: (worker.pk, pk)
+            return self.keyset_page(request, filtered_queryset, pair, mode)
+        if self.wants_ndjson(request):  # export: streamed in pk order, scored chunk by chunk
+            score = None
+            if request.data.get("worker", None):
+                worker = request.user.get_extras_for_role("Worker")
+                score = lambda data, chunk: calculate_relevance(data, [(worker.pk, i["pk"]) for i in data], mode)
+            return ndjson_response(request, filtered_queryset.order_by("pk"), lambda chunk: ShortVacancySerializer(chunk, many=True).data, score)
         serializer = ShortVacancySerializer(filtered_queryset, many=True)
         data = serializer.data
         if request.data.get("worker", None):
             worker = request.user.get_extras_for_role("Worker")
-            data = self.calculate_relevance(data, filtered_queryset, worker)
+            data = calculate_relevance(data, [(worker.pk, i["pk"]) for i in data], mode)
         return Response(data)
-    
-    def calculate_relevance(self, data, queryset, worker):  # now here are vacancies in qs and worker sep
-        worker_skills = worker.related_sw.all()
-
-        for i, j in zip(data, queryset):
-            explain = {}
-            relevance = 0
-            vacancy_skills = j.related_vs.all()
-            relevance_count = dict(Counter(vacancy_skills.values_list("relevance", flat=True)))
-            relevance_sum = sum(relevance_count.keys())
-            wages = {i.skill_id:((100/relevance_sum)*i.relevance)/relevance_count[i.relevance] for i in vacancy_skills}
-            for skill in worker_skills:
-                if skill.skill_id in wages:
-                    relevance += wages[skill.skill_id]
-                    explain[skill.skill.name] = wages[skill.skill_id]
-            i["relevance"] = relevance
-            i["explain"] = explain
-        return data
-
-
-class WorkerListAPIView(APIView):
+
+
+class WorkerListAPIView(RelevancePageMixin, KeysetPageMixin, NDJSONMixin, APIView):
+    serializer_class = ShortWorkerSerializer
+    sort_fields = {"pk": "pk", "username": "user__username"}
+
     def post(self, request):
-        qs = WorkerExtras.objects.all().select_related("user").prefetch_related("related_rw").prefetch_related("related_sw", "related_sw__skill")
+        qs = WorkerExtras.objects.all().select_related("user").prefetch_related("related_rw")
         filterset = WorkerExtrasFilter(request.data, queryset=qs)
         if filterset.is_valid():
             filtered_queryset = filterset.qs
         else:
             return Response([], status=HTTP_400_BAD_REQUEST)
+        mode = request.data.get("mode", "exact")
+        if mode not in RELEVANCE_MODES:
+            return Response({"error": f"mode must be one of {', '.join(RELEVANCE_MODES)}"}, status=HTTP_400_BAD_REQUEST)
+        if request.data.get("order", None) == "relevance":
+            if not request.data.get("vacancy", None):
+                return Response({"error": "vacancy is required for relevance ordering"}, status=HTTP_400_BAD_REQUEST)
+            vacancy = Vacancy.objects.get(pk=request.data["vacancy"])
+            if mode == "exact":
+                return self.stored_relevance_page(request, qs, filtered_queryset, Q(related_relevance__vacancy=vacancy.pk), lambda pk: (pk, vacancy.pk))
+            ids = list(dict.fromkeys(filtered_queryset.values_list("pk", flat=True)))
+            return self.relevance_page(request, qs, ids, relevance_for_vacancy(vacancy.pk, ids, mode), lambda pk: (pk, vacancy.pk))
+        if request.data.get("limit", None) or request.data.get("cursor", None):
+            pair = None
+            if request.data.get("vacancy", None):
+                vacancy = Vacancy.objects.get(pk=request.data["vacancy"])
+                pair = lambda pk: (pk, vacancy.pk)
+            return self.keyset_page(request, filtered_queryset, pair, mode)
+        if self.wants_ndjson(request):
+            score = None
+            if request.data.get("vacancy", None):
+                vacancy = Vacancy.objects.get(pk=request.data["vacancy"])
+                score = lambda data, chunk: calculate_relevance(data, [(i["pk"], vacancy.pk) for i in data], mode)
+            return ndjson_response(request, filtered_queryset.order_by("pk"), lambda chunk: ShortWorkerSerializer(chunk, many=True).data, score)
         serializer = ShortWorkerSerializer(filtered_queryset, many=True)
+        data = serializer.data
         if request.data.get("vacancy", None):
-            vacancy = Vacancy.objects.prefetch_related("related_vs").get(pk=request.data["vacancy"])
-            data = self.calculate_relevance(serializer.data, filtered_queryset, vacancy)
-        else:
-            data = serializer.data
+            vacancy = Vacancy.objects.get(pk=request.data["vacancy"])
+            data = calculate_relevance(data, [(i["pk"], vacancy.pk) for i in data], mode)
         return Response(data)
 
-    def calculate_relevance(self, data, queryset, vacancy):
-        vacancy_skills = vacancy.related_vs.all()
-        relevance_count = dict(Counter(vacancy_skills.values_list("relevance", flat=True)))
-        relevance_sum = sum(relevance_count.keys())
-        wages = {i.skill_id:((100/relevance_sum)*i.relevance)/relevance_count[i.relevance] for i in vacancy_skills}
-        #print(wages)
-        for i, j in zip(data, queryset):
-            explain = {}
-            worker_skills = list(j.related_sw.all())
-            relevance = 0
-            for skill in worker_skills:
-                if skill.skill_id in wages:
-                    relevance += wages[skill.skill_id]
-                    explain[skill.skill.name] = wages[skill.skill_id]
-            i["relevance"] = relevance
-            i["explain"] = explain
-        return data
-
 
 class OwnVacanciesAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -283,8 +356,42 @@ class OwnVacanciesAPIView(APIView):
         return Response(serializer.data)
 
 
+class RecommendedVacanciesAPIView(APIView):  # filled nightly by precompute_recommendations
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            worker = request.user.get_extras_for_role("Worker")
+        except:
+            return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
+        recommended = recommended_vacancies.objects.filter(worker=worker, vacancy__visible=True).select_related("vacancy")
+        data = ShortVacancySerializer([i.vacancy for i in recommended], many=True).data
+        for i, j in zip(data, recommended):
+            i["relevance"] = j.relevance
+        return Response(data, status=HTTP_200_OK)
+
+
+class RecommendedWorkersAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            vacancy = Vacancy.objects.select_related("hr").get(pk=pk)
+        except Vacancy.DoesNotExist:
+            return Response({"error": "vacancy does not exists"}, status=HTTP_400_BAD_REQUEST)
+        if vacancy.hr.user_id != request.user.pk:
+            return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
+        recommended = recommended_workers.objects.filter(vacancy=vacancy).select_related("worker", "worker__user")
+        data = ShortWorkerSerializer([i.worker for i in recommended], many=True).data
+        for i, j in zip(data, recommended):
+            i["relevance"] = j.relevance
+        return Response(data, status=HTTP_200_OK)
+
+
 class WorkerRequirementsAPIVIew(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     #Replaceable 
@@ -350,33 +457,47 @@ class VacancySkillsAPIView(VacancyRequirementsAPIView):
     model_class = vacancy_skills
 
 
+def autocomplete_objects(queryset, pks):  # in the ranked order of the index
+    objects = queryset.in_bulk(pks)
+    return [objects[pk] for pk in pks if pk in objects]
+
+
 class RequirementsListAPIView(APIView):
+    @catalog_etag(reference_cache.requirements, reference_cache.requirement_types, requirements_autocomplete)
     def get(self, request, group, part=""):
         data = Requirements.objects.filter(Q(requirement_type__name=group) | Q(requirement_type__name="Both"))
-        if part:
-            data = data.filter(name__icontains=part)
+        if part:  # typeahead, served from the in-memory prefix index
+            data = autocomplete_objects(data.select_related("requirement_type"), requirements_autocomplete.search(part, groups=(group, "Both")))
         serializer = RequirementsSerializer(data, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
 
 class RequirementsOptionsAPIView(APIView):
-    def get(self, request, requirement):
+    @catalog_etag(reference_cache.requirement_options, options_autocomplete)
+    def get(self, request, requirement, part=""):
         data = RequirementOptions.objects.filter(requirement__pk=requirement)
+        if part:
+            try:
+                requirement = int(requirement)
+            except ValueError:
+                return Response({"error": "requirement must be a number"}, status=HTTP_400_BAD_REQUEST)
+            data = autocomplete_objects(data, options_autocomplete.search(part, groups=(requirement,)))
         serializer = RequirementOptionsSerializer(data, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
 
 class SkillsListAPIView(APIView):
+    @catalog_etag(reference_cache.skills, reference_cache.skill_tags, skills_autocomplete)
     def get(self, request, part=""):
         data = Skills.objects.all()
         if part:
-            data = data.filter(name__icontains=part)
+            data = autocomplete_objects(data, skills_autocomplete.search(part))
         serializer = SkillsSerializer(data, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
 
 class WhoamiAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -391,17 +512,32 @@ class AddRoleAPIView(APIView):
         return Response({}, status=HTTP_200_OK)
 
 
-class VacancyResponsesAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+class VacancyResponsesAPIView(NDJSONMixin, APIView):
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, pk):  # for vacancy todo add percent
+    def score_responses(self, data, responses, vacancy):
+        for i, j in zip(data, responses):
+            i["relevance"] = j.relevance
+            i["explain"] = j.explain or {}
+        pairs = [(i.worker_id, vacancy.pk) for i in responses]
+        RequirementMatrix([w for w, _ in pairs], [vacancy.pk]).annotate(data, pairs)
+
+    def get(self, request, pk):  # for vacancy, best matching responses first
         try:
-            vacancy = Vacancy.objects.prefetch_related("related_responses", "related_responses__worker").get(pk=pk)
+            vacancy = Vacancy.objects.get(pk=pk)
         except Vacancy.DoesNotExist:
             return Response({"error": "vacancy does not exists"}, status=HTTP_400_BAD_REQUEST)
-        serializer = VacancyResponsesSerializer(vacancy.related_responses, many=True)
-        data = self.calculate_relevance(serializer.data, vacancy.related_responses.all(), vacancy)
+        responses = vacancy.related_responses.select_related("worker", "status").annotate(  # joined, ordered by the stored column
+            stored=FilteredRelation("worker__related_relevance", condition=Q(worker__related_relevance__vacancy=vacancy.pk)),
+            relevance=Coalesce(F("stored__relevance"), 0.0),
+            explain=F("stored__explain"),
+        ).order_by(F("stored__relevance").desc(nulls_last=True), "pk")
+        if self.wants_ndjson(request):
+            return ndjson_response(request, responses, lambda chunk: VacancyResponsesSerializer(chunk, many=True).data, lambda data, chunk: self.score_responses(data, chunk, vacancy))
+        serializer = VacancyResponsesSerializer(responses, many=True)
+        data = serializer.data
+        self.score_responses(data, responses, vacancy)
         return Response(data, status=HTTP_200_OK)
     
     def post(self, request, pk):
@@ -416,7 +552,7 @@ class VacancyResponsesAPIView(APIView):
         if vacancy_responses.objects.select_related("vacancy", "worker").filter(vacancy__pk=pk, worker__pk=request.user.get_extras_for_role("Worker").pk).exists():
             return Response({"error": "response already exists"}, status=HTTP_400_BAD_REQUEST)
         else:
-            vacancy_responses.objects.create(vacancy=vacancy, worker=worker, status=VacancyResponseStatuses.objects.get(name="Created"))
+            vacancy_responses.objects.create(vacancy=vacancy, worker=worker, status=reference_cache.response_statuses.get("Created"))
             if not Chat.objects.filter(user1=request.user, user2=vacancy.hr.user).exists():
                 Chat.objects.create(user1=request.user, user2=vacancy.hr.user, title="Vacancy " + vacancy.title, chat_key=str(uuid.uuid4()), vacancy=vacancy)
             return Response({}, status=HTTP_200_OK)
@@ -434,32 +570,13 @@ class VacancyResponsesAPIView(APIView):
             response = vacancy_responses.objects.select_related("vacancy", "worker").get(pk=pk)
         except vacancy_responses.DoesNotExist:
             return Response({"error": "response does not exists"}, status=HTTP_400_BAD_REQUEST)
-        response.status = VacancyResponseStatuses.objects.get(name=request.data["status"])
+        response.status = reference_cache.response_statuses.get(request.data["status"])
         response.save()
         return Response({}, status=HTTP_200_OK)
-    
-    def calculate_relevance(self, data, queryset, vacancy):
-        vacancy_skills = vacancy.related_vs.all()
-        relevance_count = dict(Counter(vacancy_skills.values_list("relevance", flat=True)))
-        relevance_sum = sum(relevance_count.keys())
-        wages = {i.skill_id:((100/relevance_sum)*i.relevance)/relevance_count[i.relevance] 
-                for i in vacancy_skills}
-        #print(wages)
-        for i, j in zip(data, queryset):
-            explain = {}
-            worker_skills = list(j.worker.related_sw.all())
-            relevance = 0
-            for skill in worker_skills:
-                if skill.skill_id in wages:
-                    relevance += wages[skill.skill_id]
-                    explain[skill.skill.name] = wages[skill.skill_id]
-            i["relevance"] = relevance
-            i["explain"] = explain
-        return data
 
 
 class WorkerResponsesAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -473,7 +590,7 @@ class WorkerResponsesAPIView(APIView):
 
 
 class SavedVacanciesListAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -517,7 +634,7 @@ class SavedVacanciesDeleteAPIView(APIView):
 
 
 class SavedUsersListAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -537,7 +654,7 @@ class SavedUsersListAPIView(APIView):
 
 
 class SavedUsersDeleteAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, pk):
@@ -552,7 +669,7 @@ class SavedUsersDeleteAPIView(APIView):
 
 
 class CreateChatAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
@@ -568,7 +685,7 @@ class CreateChatAPIView(APIView):
         if vacancy_responses.objects.filter(vacancy=vacancy, worker=user.get_extras_for_role("Worker")).exists():
             return Response({"error": "Response already exists", "chat_key": Chat.objects.filter(Q(user1=request.user, user2=user) | Q(user1=user, user2=request.user)).first().chat_key}, status=HTTP_400_BAD_REQUEST)
         else:
-            vacancy_responses.objects.create(vacancy=vacancy, worker=user.get_extras_for_role("Worker"), status=VacancyResponseStatuses.objects.get(name="Created"))
+            vacancy_responses.objects.create(vacancy=vacancy, worker=user.get_extras_for_role("Worker"), status=reference_cache.response_statuses.get("Created"))
             if not Chat.objects.filter(user1=request.user, user2=user).exists():
                 chat = Chat.objects.create(user1=request.user, user2=user, title="Vacancy " + vacancy.title, chat_key=str(uuid.uuid4()), vacancy=vacancy)
                 return Response({"chat_key": chat.chat_key}, status=HTTP_201_CREATED)
@@ -577,21 +694,22 @@ class CreateChatAPIView(APIView):
 
 
 class ComplainReasonsAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @catalog_etag(reference_cache.complain_reasons)
     def get(self, request):
-        reasons = ComplainReasons.objects.all().order_by('priority')
+        reasons = sorted(reference_cache.complain_reasons.all(), key=lambda i: i.priority)
         serializer = ComplainReasonsSerializer(reasons, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
 
 class ComplainAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        if "Moderator" in request.user.roles.values_list("name", flat=True):
+        if request.user.has_role("Moderator"):
             complains = Complains.objects.all()
             serializer = ShortComplainSerializer(complains, many=True)
             return Response(serializer.data, status=HTTP_200_OK)
@@ -607,7 +725,7 @@ class ComplainAPIView(APIView):
         except User.DoesNotExist:
             return Response({"error": "User does not exists"}, status=HTTP_400_BAD_REQUEST)
         try:
-            reason = ComplainReasons.objects.get(pk=request.data["reason"])
+            reason = reference_cache.complain_reasons.get_pk(request.data["reason"])
         except ComplainReasons.DoesNotExist:
             return Response({"error": "Reason does not exists"}, status=HTTP_400_BAD_REQUEST)
         Complains.objects.create(complier=request.user, complied=user, reason=reason, description=request.data["description"], target_type=request.data["target_type"], target_pk=request.data["target_pk"])
@@ -616,7 +734,7 @@ class ComplainAPIView(APIView):
 
 class ComplainDetailsAPIView(APIView):
     def get(self, request, pk):
-        if "Moderator" not in request.user.roles.values_list("name", flat=True):
+        if not request.user.has_role("Moderator"):
             return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
         try:
             complain = Complains.objects.get(pk=pk)
@@ -626,7 +744,7 @@ class ComplainDetailsAPIView(APIView):
         return Response(serializer.data, status=HTTP_200_OK)
     
     def delete(self, request, pk):
-        if "Moderator" not in request.user.roles.values_list("name", flat=True):
+        if not request.user.has_role("Moderator"):
             return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
         try:
             complain = Complains.objects.get(pk=pk)
@@ -636,7 +754,7 @@ class ComplainDetailsAPIView(APIView):
         return Response({}, status=HTTP_200_OK)
     
     def patch(self, request, pk):
-        if "Moderator" not in request.user.roles.values_list("name", flat=True):
+        if not request.user.has_role("Moderator"):
             return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
         try:
             complain = Complains.objects.get(pk=pk)
@@ -650,13 +768,13 @@ class ComplainDetailsAPIView(APIView):
 
 
 class VacancyQuickResponsesListAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request, vacancy_pk):
         try:
             vacancy = Vacancy.objects.get(pk=vacancy_pk)
-            if request.user != vacancy.hr.get_related_user() or "HR" not in request.user.roles.values_list("name", flat=True):
+            if request.user != vacancy.hr.get_related_user() or not request.user.has_role("HR"):
                 return Response({"error": "You don't have permission to view these quick responses"}, status=HTTP_403_FORBIDDEN)
                 
             quick_responses = VacancyQuickResponses.objects.filter(vacancy=vacancy)
@@ -684,13 +802,13 @@ class VacancyQuickResponsesListAPIView(APIView):
 
 
 class VacancyQuickResponsesDetailAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request, pk):
         try:
             quick_response = VacancyQuickResponses.objects.select_related("vacancy", "vacancy__hr").get(pk=pk)
-            if request.user != quick_response.vacancy.hr.get_related_user() or "HR" not in request.user.roles.values_list("name", flat=True):
+            if request.user != quick_response.vacancy.hr.get_related_user() or not request.user.has_role("HR"):
                 return Response({"error": "You don't have permission to view this quick response"}, status=HTTP_403_FORBIDDEN)
                 
             serializer = VacancyQuickResponsesSerializer(quick_response)
@@ -701,7 +819,7 @@ class VacancyQuickResponsesDetailAPIView(APIView):
     def put(self, request, pk):
         try:
             quick_response = VacancyQuickResponses.objects.select_related("vacancy", "vacancy__hr").get(pk=pk)
-            if request.user != quick_response.vacancy.hr.get_related_user() or "HR" not in request.user.roles.values_list("name", flat=True):
+            if request.user != quick_response.vacancy.hr.get_related_user() or not request.user.has_role("HR"):
                 return Response({"error": "You don't have permission to update this quick response"}, status=HTTP_403_FORBIDDEN)
                 
             serializer = VacancyQuickResponsesSerializer(quick_response, data=request.data)
@@ -715,7 +833,7 @@ class VacancyQuickResponsesDetailAPIView(APIView):
     def patch(self, request, pk):
         try:
             quick_response = VacancyQuickResponses.objects.select_related("vacancy", "vacancy__hr").get(pk=pk)
-            if request.user != quick_response.vacancy.hr.get_related_user() or "HR" not in request.user.roles.values_list("name", flat=True):
+            if request.user != quick_response.vacancy.hr.get_related_user() or not request.user.has_role("HR"):
                 return Response({"error": "You don't have permission to update this quick response"}, status=HTTP_403_FORBIDDEN)
                 
             serializer = VacancyQuickResponsesSerializer(quick_response, data=request.data, partial=True)
@@ -729,7 +847,7 @@ class VacancyQuickResponsesDetailAPIView(APIView):
     def delete(self, request, pk):
         try:
             quick_response = VacancyQuickResponses.objects.select_related("vacancy", "vacancy__hr").get(pk=pk)
-            if request.user != quick_response.vacancy.hr.get_related_user() or "HR" not in request.user.roles.values_list("name", flat=True):
+            if request.user != quick_response.vacancy.hr.get_related_user() or not request.user.has_role("HR"):
                 return Response({"error": "You don't have permission to delete this quick response"}, status=HTTP_403_FORBIDDEN)
                 
             quick_response.delete()
@@ -739,17 +857,18 @@ class VacancyQuickResponsesDetailAPIView(APIView):
 
 
 class VacancyResponseStatusesListAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
+    @catalog_etag(reference_cache.response_statuses)
     def get(self, request):
-        statuses = VacancyResponseStatuses.objects.all()
+        statuses = reference_cache.response_statuses.all()
         serializer = VacancyResponseStatusesSerializer(statuses, many=True)
         return Response(serializer.data, status=HTTP_200_OK)
 
 
 class ChatQuickResponsesListAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request, chat_key):
@@ -774,13 +893,13 @@ class ChatQuickResponsesListAPIView(APIView):
         
             
 class ComplainDeletionAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
         try:
             complain = Complains.objects.get(pk=request.data["complain_id"])
-            if "Moderator" not in request.user.roles.values_list("name", flat=True):
+            if not request.user.has_role("Moderator"):
                 return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
 
             if complain.target_type == "Profile":
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from .fanout import chat_list_fanout
+from .framing import chat_group, room_event
+from .history_cache import recent_history
+from .models import Chat, Message
+
+FLUSH_INTERVAL = 0.005  # seconds a message may wait for others before it is written
+FLUSH_BATCH = 100  # or written as soon as this many are waiting
+ID_BLOCK = 100  # ids taken from the sequence per round trip
+
+logger = logging.getLogger(__name__)
+
+
+def write_behind_enabled() -> bool:  # ids are allocated from the Postgres sequence before the row exists
+    return getattr(settings, "CHAT_WRITE_BEHIND", False) and connection.vendor == "postgresql"
+
+
+class MessageBuffer:  # messages get their id and sent_date on arrival, rows are bulk inserted shortly after
+    def __init__(self):
+        self._lock = threading.Lock()  # queue and id block
+        self._flush_lock = threading.Lock()  # one batch at a time, so rows are written in arrival order
+        self._queue = deque()
+        self._ids = deque()
+        self._scheduled = False
+
+    def _allocate_ids(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [Message._meta.db_table, ID_BLOCK],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _next_id(self) -> int:
+        with self._lock:
+            if self._ids:
+                return self._ids.popleft()
+        ids = self._allocate_ids()
+        with self._lock:
+            self._ids.extend(ids)
+            return self._ids.popleft()
+
+    def _enqueue(self, chat: Chat, sender, content: str) -> Message:
+        if len(content) > Message._meta.get_field("content").max_length:  # checked now, a bad row would fail the whole batch
+            raise ValueError("Message is too long")
+        pk = self._next_id()
+        with self._lock:  # sent_date is taken with the queue position, so (sent_date, id) follows arrival order
+            message = Message(pk=pk, chat=chat, sender=sender, content=content, status="sent", sent_date=timezone.now())
+            self._queue.append(message)
+            return message
+
+    def _schedule(self):  # one flush timer at a time, none while the queue is empty
+        with self._lock:
+            if self._scheduled or not self._queue:
+                return
+            self._scheduled = True
+        asyncio.get_running_loop().call_later(FLUSH_INTERVAL, lambda: asyncio.ensure_future(self.flush()))
+
+    async def add(self, chat: Chat, sender, content: str) -> Message:
+        if sender.pk not in (chat.user1_id, chat.user2_id):
+            raise ValueError("User doesn't have access to this chat")
+        message = await sync_to_async(self._enqueue)(chat, sender, content)
+        with self._lock:
+            full = len(self._queue) >= FLUSH_BATCH
+        if full:
+            await self.flush()
+        else:
+            self._schedule()
+        return message
+
+    def _insert(self, messages: list):  # rows and the counters of their chats in one transaction
+        with transaction.atomic():
+            Message.objects.bulk_create(messages)
+            for chat_pk in {m.chat_id for m in messages}:
+                chat_messages = [m for m in messages if m.chat_id == chat_pk]
+                chat, last = chat_messages[0].chat, chat_messages[-1]
+                Chat.objects.filter(pk=chat_pk).update(
+                    last_message=last,
+                    last_message_at=last.sent_date,
+                    user1_unread=F("user1_unread") + sum(m.sender_id != chat.user1_id for m in chat_messages),
+                    user2_unread=F("user2_unread") + sum(m.sender_id != chat.user2_id for m in chat_messages),
+                )
+
+    def _write(self):  # (written, dropped)
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._queue)
+                self._queue.clear()
+                self._scheduled = False
+            if not batch:
+                return [], []
+            try:
+                self._insert(batch)
+            except Exception:
+                logger.exception("Failed to write %s buffered messages, writing them one by one", len(batch))
+            else:
+                return batch, []
+            written, dropped = [], []  # a bad row is dropped instead of holding back the queue
+            for message in batch:
+                try:
+                    self._insert([message])
+                except Exception:
+                    logger.exception("Dropped buffered message %s of chat %s", message.pk, message.chat_id)
+                    dropped.append(message)
+                else:
+                    written.append(message)
+            return written, dropped
+
+    async def _retract(self, dropped: list):  # the messages were already broadcast and cached on arrival
+        channel_layer = get_channel_layer()
+        for chat_key in {m.chat.chat_key for m in dropped}:
+            await sync_to_async(recent_history.invalidate)(chat_key)
+        for m in dropped:
+            await channel_layer.group_send(chat_group(m.chat.chat_key), room_event("delete.message", {
+                "chat_key": m.chat.chat_key, "message_pk": m.pk, "error": "Message could not be stored",
+            }))
+
+    async def flush(self):
+        batch, dropped = await sync_to_async(self._write)()
+        self._schedule()  # messages that arrived while writing
+        if dropped:
+            await self._retract(dropped)
+        last = {m.chat_id: m for m in batch}  # bulk_create sends no post_save, the chat lists are notified here
+        for m in last.values():
+            chat_list_fanout.publish((m.chat.user1_id, m.chat.user2_id), m.chat.chat_key, {"new_message": m.content})
+
+
+message_buffer = MessageBuffer()
@@ -1,83 +1,77 @@
-import json
-
 from channels.generic.websocket import AsyncWebsocketConsumer
 from asgiref.sync import sync_to_async
+from django.db.models import Q
 from .models import Chat, Message
-from cauth.models import User
-from .serializers import MessageSerializer, ChatSerializer
+from .serializers import MessageSerializer, ChatSummarySerializer
+from .buffer import message_buffer, write_behind_enabled
+from .framing import FramedConsumerMixin, room_event, chat_list_event, chat_group
+from .history_cache import recent_history
 from urllib.parse import parse_qs
-from django.db.models import Q
 from cauth.serializers import WhoamiProfileSerializer
+from cauth.authentication import authenticate_token
+from cauth.pagination import get_limit
+from rest_framework.exceptions import AuthenticationFailed
 
 
-class GeneralConsumer(AsyncWebsocketConsumer):
+class GeneralConsumer(FramedConsumerMixin, AsyncWebsocketConsumer):
     async def _authorize(self):
         token = parse_qs(self.scope.get("query_string", b"")).get(b"authorization", b"")
         if token:
             token = str(token[0]).split(" ")[-1][:-1]  # because of format "Token #####"
             try:
-                user = await User.objects.prefetch_related("auth_token").aget(auth_token__key=token)
+                user, _ = await sync_to_async(authenticate_token)(token)
                 if self.chat_instance.user1.pk == user.pk or self.chat_instance.user2.pk == user.pk:
                     return user
                 else:
                     return False
-            except User.DoesNotExist:
+            except AuthenticationFailed:
                 return False
         else:
             return False
 
 
-class ChatConsumer(GeneralConsumer):  
-    async def connect(self): 
-        self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
-        self.room_group_name = f"chat_{self.room_name}"
-        # Join room group
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-
-        self.chat_instance = await Chat.objects.select_related("user1", "user2").aget(chat_key=self.room_name)
-        authorized = await self._authorize()
-        if authorized:
-            self.user = authorized
-            await self.accept()
-        else:
-            await self.close(code=4001, reason="Authorization error")
-
-    async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)  # deletes channel
-        super().disconnect(close_code)
-
-    
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+class ChatMessagesMixin:  # chat actions and room events shared by the single chat and the multiplexed consumers
+    async def handle_chat_message(self, chat, text_data_json):  # chat is one the user takes part in
+        group = chat_group(chat.chat_key)
+        text_data_json["chat_key"] = chat.chat_key  # events carry their chat for multiplexed sockets
         msg_type = text_data_json.get("type")
+        write_behind = write_behind_enabled()
+        if write_behind and msg_type != "send.message":  # the other messages may refer to buffered rows
+            await message_buffer.flush()
 
         if msg_type == "send.message":
             try:
-                saved_msg = await self.chat_instance.astore_message(sender_pk=self.user.pk, content=text_data_json["message"])
+                if write_behind:
+                    saved_msg = await message_buffer.add(chat, self.user, text_data_json["message"])
+                else:
+                    saved_msg = await chat.astore_message(sender_pk=self.user.pk, content=text_data_json["message"])
                 serializer = MessageSerializer(saved_msg)
                 msg_json = await sync_to_async(lambda: serializer.data)()
-                msg_json["type"] = "send.message" 
-                await self.channel_layer.group_send(self.room_group_name, msg_json)
+                await sync_to_async(recent_history.push)(chat.chat_key, dict(msg_json))
+                msg_json["type"] = "send.message"
+                msg_json["chat_key"] = chat.chat_key
+                await self.channel_layer.group_send(group, room_event("send.message", msg_json))  # encoded once for every recipient
             except ValueError as e:
-                await self.send(json.dumps({"error": str(e)}))
+                await self.send_payload({"chat_key": chat.chat_key, "error": str(e)})
         
         elif msg_type == "edit.message":
             mpk = text_data_json["message_pk"]
             spk = self.user.pk
             try:
-                m = await Message.objects.select_related("sender").aget(pk=mpk)  # TODO remove unused fields
+                m = await Message.objects.select_related("sender", "chat").aget(pk=mpk, chat=chat)  # TODO remove unused fields
             except Message.DoesNotExist:
-                await self.send(json.dumps({"error": "No such message"}))
+                await self.send_payload({"chat_key": chat.chat_key, "error": "No such message"})
                 return
             if m.sender.pk != spk:
-                await self.send(json.dumps({"error": "Forbidden"}))
+                await self.send_payload({"chat_key": chat.chat_key, "error": "Forbidden"})
                 return
             serializer = MessageSerializer(instance=m, data={"content": text_data_json["new_content"]}, partial=True)
             if serializer.is_valid():
                 await sync_to_async(serializer.save)()
-                await self.channel_layer.group_send(self.room_group_name, text_data_json)
+                await sync_to_async(recent_history.replace)(chat.chat_key, dict(serializer.data))
+                await self.channel_layer.group_send(group, room_event(msg_type, text_data_json))
             else:
-                await self.send(json.dumps({"error": serializer.errors}))
+                await self.send_payload({"chat_key": chat.chat_key, "error": serializer.errors})
                 return
             
 
@@ -86,59 +80,119 @@ class ChatConsumer(GeneralConsumer):
             mpk = text_data_json["message_pk"]
             spk = self.user.pk
             try:
-                m = await Message.objects.select_related("sender").aget(pk=mpk)  # TODO remove unused fields
+                m = await Message.objects.select_related("sender", "chat").aget(pk=mpk, chat=chat)  # TODO remove unused fields
             except Message.DoesNotExist:
-                await self.send(json.dumps({"error": "No such message"}))
+                await self.send_payload({"chat_key": chat.chat_key, "error": "No such message"})
                 return
             if m.sender.pk != spk:
-                await self.send(json.dumps({"error": "Forbidden"}))
+                await self.send_payload({"chat_key": chat.chat_key, "error": "Forbidden"})
                 return
             await m.adelete()
-            await self.channel_layer.group_send(self.room_group_name, text_data_json)
+            await sync_to_async(recent_history.remove)(chat.chat_key, m.pk)
+            await self.channel_layer.group_send(group, room_event(msg_type, text_data_json))
 
 
         elif msg_type == "get_history":
             chunk = text_data_json.get("chunk", 0)
             chunk_size = text_data_json.get("chunk_size", 10)
-            data = await sync_to_async(self.chat_instance.get_history)(chunk=chunk, chunk_size=chunk_size)
-            serializer = MessageSerializer(data, many=True)
-            serialized = await sync_to_async(lambda: serializer.data)()
+            before, limit = text_data_json.get("before"), text_data_json.get("limit")
+            try:
+                if limit is not None:
+                    limit = get_limit(text_data_json)
+                size = limit if limit is not None else chunk_size
+                serialized = None
+                if before is None and (limit is not None or chunk == 0) and isinstance(size, int) and size > 0:  # the newest page, served already serialized
+                    serialized = await sync_to_async(recent_history.page)(chat, size)
+                if serialized is None:  # older pages and pages larger than the cache
+                    data = await sync_to_async(lambda: list(chat.get_history(chunk=chunk, chunk_size=chunk_size, before=before, limit=limit)))()
+                    serializer = MessageSerializer(data, many=True)
+                    serialized = await sync_to_async(lambda: serializer.data)()
+            except ValueError as e:
+                await self.send_payload({"chat_key": chat.chat_key, "error": str(e)})
+                return
             
-            await self.send(json.dumps({"history": serialized}))
+            response = {"chat_key": chat.chat_key, "history": serialized}
+            if before is not None or limit is not None:  # keyset mode, the next page starts before the oldest message sent
+                response["before"] = serialized[-1]["pk"] if serialized else None
+            await self.send_payload(response)
         
         elif msg_type == "whoami":
             whs = WhoamiProfileSerializer(self.user)
             whsdata = await sync_to_async(lambda:whs.data)
-            await self.send(json.dumps(whsdata))
+            await self.send_payload(whsdata)
         
+        elif msg_type == "mark.read":  # everything received up to message_pk, one event instead of one per message
+            try:
+                up_to = int(text_data_json["message_pk"])
+            except (KeyError, ValueError, TypeError):
+                await self.send_payload({"chat_key": chat.chat_key, "error": "message_pk must be a number"})
+                return
+            count = await chat.amark_read(self.user.pk, up_to)
+            if count:
+                await sync_to_async(recent_history.invalidate)(chat.chat_key)  # statuses of cached messages changed
+                await self.channel_layer.group_send(group, room_event("mark.read", {"chat_key": chat.chat_key, "reader": self.user.username, "message_pk": up_to, "count": count}))
+                await self.channel_layer.group_send("chat_list_updates_"+str(self.user.pk), chat_list_event({"event": "read", "chat_key": chat.chat_key, "count": count}))
+            else:
+                await self.send_payload({"type": "mark.read", "chat_key": chat.chat_key, "reader": self.user.username, "message_pk": up_to, "count": 0})
+
         elif msg_type == "update.status":  # TODO tests
-            m = await Message.objects.aget(pk=text_data_json["message_pk"])
+            m = await Message.objects.select_related("chat").aget(pk=text_data_json["message_pk"], chat=chat)
             await m.aupdate_status(text_data_json["new_status"])
-            await self.channel_layer.group_send(self.room_group_name, text_data_json)
+            await sync_to_async(recent_history.invalidate)(chat.chat_key)
+            await self.channel_layer.group_send(group, room_event(msg_type, text_data_json))
 
     async def send_message(self, event): 
-        await self.send(text_data=json.dumps(event)) 
+        await self.send_frames(event)
     
     async def edit_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send_frames(event)
 
     async def delete_message(self,event):
-        await self.send(text_data=json.dumps(event))
+        await self.send_frames(event)
 
     async def update_status(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send_frames(event)
+
+    async def mark_read(self, event):
+        await self.send_frames(event)
 
 
-class ChatListConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(ChatMessagesMixin, GeneralConsumer):  
+    async def connect(self): 
+        self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
+        self.room_group_name = chat_group(self.room_name)
+        # Join room group
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+
+        self.chat_instance = await Chat.objects.select_related("user1", "user2").aget(chat_key=self.room_name)
+        authorized = await self._authorize()
+        if authorized:
+            self.user = authorized
+            await self.accept_framed()
+        else:
+            await self.close(code=4001, reason="Authorization error")
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)  # deletes channel
+        if write_behind_enabled():
+            await message_buffer.flush()
+        super().disconnect(close_code)
+
+    
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.handle_chat_message(self.chat_instance, self.decode_frame(text_data, bytes_data))
+
+
+class ChatListConsumer(FramedConsumerMixin, AsyncWebsocketConsumer):
 
     async def _authorize(self):
         token = parse_qs(self.scope.get("query_string", b"")).get(b"authorization", b"")
         if token:
             token = str(token[0]).split(" ")[-1][:-1]  # because of format "Token #####"
             try:
-                user = await User.objects.prefetch_related("auth_token").aget(auth_token__key=token)
+                user, _ = await sync_to_async(authenticate_token)(token)
                 return user
-            except User.DoesNotExist:
+            except AuthenticationFailed:
                 return False
         else:
             return False
@@ -150,16 +204,13 @@ class ChatListConsumer(AsyncWebsocketConsumer):
             return
         self.layer_name = "chat_list_updates_"+str(user.pk)
         await self.channel_layer.group_add(self.layer_name, self.channel_name)  
-        await self.accept()
-        chats = await sync_to_async(Chat.objects.filter)(Q(user1=user)|Q(user2=user))
-        serializer = ChatSerializer(chats, many=True)     
+        await self.accept_framed()
+        serializer = ChatSummarySerializer(Chat.objects.summaries(user), many=True)  # one query for the whole list
         data = await sync_to_async(lambda: serializer.data)()
-        for i, j in zip(data, chats): 
-            i["unread"] = await sync_to_async(j.get_unread)(user)
-        await self.send(text_data=json.dumps(data))
+        await self.send_payload(data)
     
-    async def receive(self, text_data): 
-        return await super().receive(text_data)
+    async def receive(self, text_data=None, bytes_data=None): 
+        return await super().receive(text_data, bytes_data)
     
     async def disconnect(self, code):
          await self.channel_layer.group_discard(
@@ -168,7 +219,70 @@ class ChatListConsumer(AsyncWebsocketConsumer):
         )
     
     async def chat_list_activity(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "chat_list_update",
-            "event_details": event
-        }))
\ No newline at end of file
+        if "frames" in event:
+            await self.send_frames(event)
+        else:
+            await self.send_payload({
+                "type": "chat_list_update",
+                "event_details": event
+            })
+
+
+class MultiChatConsumer(ChatMessagesMixin, ChatListConsumer):  # one socket for the chat list and any number of open chats
+    async def connect(self):
+        user = await self._authorize()
+        if not user:
+            await self.close(code=4001, reason="Authorization error")
+            return
+        self.user = user
+        self.chats = {}  # chat key -> subscribed chat
+        self.layer_name = "chat_list_updates_"+str(user.pk)
+        await self.channel_layer.group_add(self.layer_name, self.channel_name)
+        await self.accept_framed()
+        serializer = ChatSummarySerializer(Chat.objects.summaries(user), many=True)
+        data = await sync_to_async(lambda: serializer.data)()
+        await self.send_payload({"type": "chat_list", "chats": data})
+
+    async def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.decode_frame(text_data, bytes_data)
+        msg_type = text_data_json.get("type")
+
+        if msg_type in ("subscribe", "unsubscribe"):
+            keys = text_data_json.get("chat_keys")
+            if not isinstance(keys, list):
+                await self.send_payload({"error": "chat_keys must be a list"})
+                return
+            if msg_type == "subscribe":  # only chats the user takes part in, one query for all of them
+                found = Chat.objects.select_related("user1", "user2").filter(Q(user1=self.user) | Q(user2=self.user), chat_key__in=keys)
+                async for chat in found:
+                    if chat.chat_key not in self.chats:
+                        await self.channel_layer.group_add(chat_group(chat.chat_key), self.channel_name)
+                    self.chats[chat.chat_key] = chat
+            else:
+                for key in keys:
+                    if self.chats.pop(key, None) is not None:
+                        await self.channel_layer.group_discard(chat_group(key), self.channel_name)
+            await self.send_payload({
+                "type": "subscriptions",
+                "chat_keys": list(self.chats),
+                "rejected": [key for key in keys if msg_type == "subscribe" and key not in self.chats],
+            })
+
+        elif msg_type == "whoami":
+            whs = WhoamiProfileSerializer(self.user)
+            await self.send_payload(await sync_to_async(lambda: whs.data)())
+
+        else:  # chat actions are routed by chat_key
+            chat = self.chats.get(text_data_json.get("chat_key"))
+            if chat is None:
+                await self.send_payload({"chat_key": text_data_json.get("chat_key"), "error": "Not subscribed to this chat"})
+                return
+            await self.handle_chat_message(chat, text_data_json)
+
+    async def disconnect(self, code):
+        for key in getattr(self, "chats", {}):
+            await self.channel_layer.group_discard(chat_group(key), self.channel_name)
+        if write_behind_enabled():
+            await message_buffer.flush()
+        if hasattr(self, "layer_name"):
+            await super().disconnect(code)
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+from typing import Iterable
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from .framing import chat_list_event
+
+FANOUT_WINDOW = 0.02  # seconds chat list updates are collected before they are sent
+
+
+async def running_loop():
+    return asyncio.get_running_loop()
+
+
+class ChatListFanout:  # merges chat list updates per (user, chat), one chat.list.activity per user per window
+    def __init__(self, window: float = FANOUT_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()  # publishers run on several loops and threads
+        self._pending = {}  # user pk -> chat key -> merged update
+        self._due = None  # monotonic time the scheduled window is sent at
+
+    def publish(self, user_pks: Iterable[int], chat_key: str, update: dict):  # returns at once, the window is sent by a timer
+        with self._lock:
+            now = time.monotonic()
+            leader = self._due is None or now > self._due + self.window  # the first publisher of a window schedules it, or takes over a timer lost with its loop
+            if leader:
+                self._due = now + self.window
+            for user_pk in user_pks:
+                self._pending.setdefault(user_pk, {}).setdefault(chat_key, {"chat_key": chat_key}).update(update)
+        if not leader:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # sync code, e.g. an on_commit callback: the loop of the surrounding sync_to_async, if any
+            loop = async_to_sync(running_loop)()
+            if not loop.is_running():  # no loop outlives this call, e.g. a WSGI request
+                timer = threading.Timer(self.window, async_to_sync(self.flush))
+                timer.daemon = True
+                timer.start()
+                return
+            loop.call_soon_threadsafe(self._schedule, loop)
+            return
+        self._schedule(loop)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop):
+        loop.call_later(self.window, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        with self._lock:
+            pending, self._pending, self._due = self._pending, {}, None
+        channel_layer = get_channel_layer()
+        for user_pk, updates in pending.items():
+            await channel_layer.group_send(
+                "chat_list_updates_"+str(user_pk),
+                chat_list_event({"event": "last_update", "updates": list(updates.values())})
+            )
+
+
+chat_list_fanout = ChatListFanout()
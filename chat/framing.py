@@ -0,0 +1,52 @@
+import json
+import msgpack
+
+MSGPACK_SUBPROTOCOL = "msgpack"  # binary frames, asked for with Sec-WebSocket-Protocol: msgpack
+
+
+def chat_group(chat_key: str) -> str:
+    return f"chat_{chat_key}"
+
+
+def encode_frames(payload: dict) -> dict:  # every format once per broadcast, each recipient sends the one it negotiated
+    return {"json": json.dumps(payload), "msgpack": msgpack.packb(payload)}
+
+
+def room_event(event_type: str, payload: dict) -> dict:  # group_send event for the chat room handlers
+    return {"type": event_type, "frames": encode_frames({"type": event_type, **payload})}
+
+
+def chat_list_event(details: dict) -> dict:  # group_send event for chat_list_activity, framed like before
+    details = {"type": "chat.list.activity", **details}
+    return {"type": "chat.list.activity", "frames": encode_frames({"type": "chat_list_update", "event_details": details})}
+
+
+class FramedConsumerMixin:  # JSON text frames by default, MessagePack binary frames when the client negotiates it
+    frame_format = "json"
+
+    async def accept_framed(self):
+        if MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.frame_format = "msgpack"
+            await self.accept(subprotocol=MSGPACK_SUBPROTOCOL)
+        else:
+            await self.accept()
+
+    def decode_frame(self, text_data=None, bytes_data=None) -> dict:
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data)
+        return json.loads(text_data)
+
+    async def send_payload(self, payload):  # replies to this socket only
+        if self.frame_format == "msgpack":
+            await self.send(bytes_data=msgpack.packb(payload))
+        else:
+            await self.send(text_data=json.dumps(payload))
+
+    async def send_frames(self, event: dict):  # group events arrive encoded, events without frames are encoded here
+        frames = event.get("frames")
+        if frames is None:
+            await self.send_payload(event)
+        elif self.frame_format == "msgpack":
+            await self.send(bytes_data=frames["msgpack"])
+        else:
+            await self.send(text_data=frames["json"])
@@ -0,0 +1,165 @@
+import json
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, List, Optional
+import redis
+from cauth.redis_client import get_redis
+from .models import Chat
+from .serializers import MessageSerializer
+
+HISTORY_CACHE_SIZE = 50  # newest serialized messages kept per chat
+HISTORY_CACHE_CHATS = 1000  # chats kept in process
+HISTORY_CACHE_TTL = 24 * 60 * 60  # seconds an idle chat stays in Redis
+END = None  # after the oldest message when the chat has no older ones
+
+
+class RecentHistory:  # newest messages per chat, newest first: LRU of ring buffers in process, Redis lists shared
+    def __init__(self, size: int = HISTORY_CACHE_SIZE, chats: int = HISTORY_CACHE_CHATS):
+        self.size = size
+        self.chats = chats
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()  # chat key -> (version, deque of messages and END)
+        self._versions = {}  # chat key -> local version, used when there is no shared Redis
+
+    @staticmethod
+    def _list_key(chat_key: str) -> str:
+        return f"chat:history:{chat_key}"
+
+    @staticmethod
+    def _version_key(chat_key: str) -> str:
+        return f"chat:history:{chat_key}:version"
+
+    def _version(self, chat_key: str) -> Optional[int]:  # None when Redis is unreachable, the cache is skipped then
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                return self._versions.get(chat_key, 0)
+        try:
+            return int(client.get(self._version_key(chat_key)) or 0)
+        except redis.RedisError:
+            return None
+
+    def _remember(self, chat_key: str, version: int, items):
+        with self._lock:
+            self._entries[chat_key] = (version, deque(items, maxlen=self.size))
+            self._entries.move_to_end(chat_key)
+            while len(self._entries) > self.chats:
+                self._entries.popitem(last=False)
+
+    def _local(self, chat_key: str, version: int):
+        with self._lock:
+            entry = self._entries.get(chat_key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(chat_key)
+            return list(entry[1])
+
+    def _items(self, chat_key: str):  # process copy if current, else the Redis list
+        version = self._version(chat_key)
+        if version is None:
+            return None
+        items = self._local(chat_key, version)
+        client = get_redis()
+        if items is not None or client is None:
+            return items
+        try:
+            raw = client.lrange(self._list_key(chat_key), 0, -1)
+        except redis.RedisError:
+            return None
+        if not raw:
+            return None
+        items = [json.loads(item) for item in raw]
+        self._remember(chat_key, version, items)
+        return items
+
+    def load(self, chat: Chat) -> Optional[List[dict]]:  # fills the cache from the database
+        version = self._version(chat.chat_key)
+        if version is None:
+            return None
+        messages = list(chat.get_history(limit=self.size).select_related("sender"))
+        items = list(MessageSerializer(messages, many=True).data)
+        if len(items) < self.size:
+            items.append(END)
+        client = get_redis()
+        if client is not None:
+            try:
+                with client.pipeline() as pipe:  # skipped when a message arrived while reading
+                    pipe.watch(self._version_key(chat.chat_key))
+                    if int(pipe.get(self._version_key(chat.chat_key)) or 0) != version:
+                        return items
+                    pipe.multi()
+                    pipe.delete(self._list_key(chat.chat_key))
+                    pipe.rpush(self._list_key(chat.chat_key), *(json.dumps(item) for item in items))
+                    pipe.expire(self._list_key(chat.chat_key), HISTORY_CACHE_TTL)
+                    pipe.execute()
+            except (redis.WatchError, redis.RedisError):
+                return items
+            self._remember(chat.chat_key, version, items)
+            return items
+        with self._lock:
+            if self._versions.get(chat.chat_key, 0) == version:
+                self._remember(chat.chat_key, version, items)
+        return items
+
+    def page(self, chat: Chat, size: int) -> Optional[List[dict]]:  # newest size messages, None when not cached
+        items = self._items(chat.chat_key)
+        if items is None:
+            items = self.load(chat)
+        if items is None:
+            return None
+        complete = bool(items) and items[-1] is END
+        seen = set()  # a message stored just before a load can be pushed once more
+        messages = [item for item in items if item is not END and not (item["pk"] in seen or seen.add(item["pk"]))]
+        if size > len(messages) and not complete:
+            return None
+        return messages[:size]
+
+    def _change(self, chat_key: str, apply: Optional[Callable[[deque], None]], shared):  # shared(pipe) changes the Redis list, no apply drops the copy
+        client = get_redis()
+        if client is None:
+            with self._lock:
+                version = self._versions.get(chat_key, 0)
+                self._versions[chat_key] = version + 1
+                entry = self._entries.pop(chat_key, None)
+                if apply is not None and entry is not None and entry[0] == version:
+                    apply(entry[1])
+                    self._remember(chat_key, version + 1, entry[1])
+            return
+        with self._lock:
+            entry = self._entries.pop(chat_key, None)
+        try:
+            pipe = client.pipeline()
+            shared(pipe)
+            pipe.incr(self._version_key(chat_key))
+            version = pipe.execute()[-1]
+        except redis.RedisError:
+            return
+        if apply is not None and entry is not None and entry[0] == version - 1:  # nothing else changed the chat in between
+            apply(entry[1])
+            self._remember(chat_key, version, entry[1])
+
+    def push(self, chat_key: str, message: dict):
+        def shared(pipe):  # only extends lists that exist, a missing one is loaded from the database
+            pipe.lpushx(self._list_key(chat_key), json.dumps(message))
+            pipe.ltrim(self._list_key(chat_key), 0, self.size - 1)
+        self._change(chat_key, lambda items: items.appendleft(message), shared)
+
+    def replace(self, chat_key: str, message: dict):
+        def apply(items):
+            for i, item in enumerate(items):
+                if item is not END and item["pk"] == message["pk"]:
+                    items[i] = message
+        self._change(chat_key, apply, lambda pipe: pipe.delete(self._list_key(chat_key)))
+
+    def remove(self, chat_key: str, pk: int):
+        def apply(items):
+            for item in list(items):
+                if item is not END and item["pk"] == pk:
+                    items.remove(item)
+        self._change(chat_key, apply, lambda pipe: pipe.delete(self._list_key(chat_key)))
+
+    def invalidate(self, chat_key: str):  # e.g. statuses changed, reloaded by the next read
+        self._change(chat_key, None, lambda pipe: pipe.delete(self._list_key(chat_key)))
+
+
+recent_history = RecentHistory()
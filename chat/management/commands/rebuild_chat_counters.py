@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from chat.models import Chat
+
+
+class Command(BaseCommand):
+    help = "Recompute last message and unread counters of every chat, e.g. after messages were written around the models"
+
+    def handle(self, *args, **options):
+        count = 0
+        for chat in Chat.objects.order_by("pk").iterator(chunk_size=500):
+            chat.rebuild_counters()
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} chats rebuilt"))
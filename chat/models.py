@@ -1,6 +1,36 @@
-from django.db import models
+from django.db import models, transaction
 from cauth.models import User
-from django.db.models import Q
+from django.db.models import Q, F, Case, When, OuterRef, Subquery
+from django.db.models.functions import Greatest
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+def unread_update(sender_id: int, delta: int) -> dict:  # Chat.update() kwargs moving the counters of the other participant
+    return {
+        f"{user}_unread": Case(When(**{user: sender_id}, then=F(f"{user}_unread")), default=Greatest(F(f"{user}_unread") + delta, 0))
+        for user in ("user1", "user2")
+    }
+
+
+def history_before(before) -> Q:
+    if isinstance(before, int) or str(before).isdigit():
+        anchor = Message.objects.filter(pk=int(before)).values("sent_date")
+        return Q(sent_date__lt=Subquery(anchor)) | Q(sent_date=Subquery(anchor), pk__lt=int(before))
+    date = parse_datetime(str(before))
+    if date is None:
+        raise ValueError("before must be a message pk or a timestamp")
+    return Q(sent_date__lt=date)
+
+
+class ChatQuerySet(models.QuerySet):
+    def summaries(self, user):  # user's chats with unread count and last message, read from the denormalized fields
+        return self.filter(Q(user1=user) | Q(user2=user)).annotate(
+            unread=Case(When(user1=user, then=F("user1_unread")), default=F("user2_unread")),
+            last_message_content=F("last_message__content"),
+            last_message_date=F("last_message_at"),
+        ).order_by(F("last_message_at").desc(nulls_last=True), "-pk")
 
 
 class Chat(models.Model): 
@@ -10,33 +40,70 @@ class Chat(models.Model):
     chat_key = models.CharField(max_length=128, unique=True)
     vacancy = models.ForeignKey(to="cauth.Vacancy", on_delete=models.CASCADE, related_name="related_chats", null=True, blank=True)
 
-    def store_message(self, sender_pk: int, content:str):  # TODO sender not only pk
+    # maintained by the message write paths, so chat lists never aggregate over Message
+    last_message = models.ForeignKey(to="Message", on_delete=models.SET_NULL, related_name="+", null=True, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    user1_unread = models.PositiveIntegerField(default=0)
+    user2_unread = models.PositiveIntegerField(default=0)
+
+    objects = ChatQuerySet.as_manager()
+
+    def store_message(self, sender_pk: int, content:str, status="created"):  # TODO sender not only pk
         sender = User.objects.get(pk=sender_pk)
         if (self.user1 != sender and self.user2 != sender):
             raise ValueError("User doesn't have access to this chat")
-        return Message.objects.create(chat=self, sender=sender, content=content)
+        with transaction.atomic():
+            message = Message.objects.create(chat=self, sender=sender, content=content, status=status)
+            Chat.objects.filter(pk=self.pk).update(last_message=message, last_message_at=message.sent_date, **unread_update(sender.pk, int(status == "sent")))
+        return message
     
     async def astore_message(self, sender_pk: int, content:str, status="sent"):
-        sender = await User.objects.aget(pk=sender_pk)
-        if (self.user1 != sender and self.user2 != sender):
-            raise ValueError("User doesn't have access to this chat")
-        return await Message.objects.acreate(chat=self, sender=sender, content=content, status=status)
-    
-    def get_history(self, chunk:int = 0, chunk_size:int = 10):
-        return Message.objects.filter(chat=self)[chunk*chunk_size:(chunk+1)*chunk_size]
+        return await sync_to_async(self.store_message)(sender_pk, content, status)
+
+    def rebuild_counters(self):  # recomputes the denormalized fields from Message
+        messages = Message.objects.filter(chat=self)
+        last = messages.order_by("-sent_date", "-pk").first()
+        Chat.objects.filter(pk=self.pk).update(
+            last_message=last,
+            last_message_at=last.sent_date if last else None,
+            user1_unread=messages.filter(status="sent").exclude(sender=self.user1_id).count(),
+            user2_unread=messages.filter(status="sent").exclude(sender=self.user2_id).count(),
+        )
     
-    def last_message(self):
-        return Message.objects.filter(chat=self).order_by("-sent_date").first()
+    def get_history(self, chunk:int = 0, chunk_size:int = 10, before=None, limit:int = None):
+        messages = Message.objects.filter(chat=self)
+        if before is None and limit is None:  # offset pages, kept for old clients
+            return messages[chunk*chunk_size:(chunk+1)*chunk_size]
+        if before is not None:  # keyset: strictly older than a message pk or a timestamp, served by the (chat, -sent_date, -id) index
+            messages = messages.filter(history_before(before))
+        return messages[:limit or chunk_size]
     
+    def mark_read(self, reader_pk: int, up_to: int) -> int:  # one UPDATE for every message of the other side up to a watermark
+        counter = "user1_unread" if reader_pk == self.user1_id else "user2_unread"
+        with transaction.atomic():
+            count = Message.objects.filter(chat=self, status="sent", pk__lte=up_to).exclude(sender=reader_pk).update(status="read")
+            if count:
+                Chat.objects.filter(pk=self.pk).update(**{counter: Greatest(F(counter) - count, 0)})
+        return count
+
+    async def amark_read(self, reader_pk: int, up_to: int) -> int:
+        return await sync_to_async(self.mark_read)(reader_pk, up_to)
+
     def get_unread(self, user):
         return Message.objects.filter(chat=self, status="sent").exclude(sender=user).count()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["user1", "-last_message_at"]),
+            models.Index(fields=["user2", "-last_message_at"]),
+        ]
+
 
 class Message(models.Model):
     chat = models.ForeignKey(to=Chat, on_delete=models.CASCADE, related_name="related_messages")
     sender = models.ForeignKey(to=User, on_delete=models.CASCADE, related_name="related_messages", null=True, blank=True)
     content = models.CharField(max_length=2048)
-    sent_date = models.DateTimeField(auto_now_add=True)
+    sent_date = models.DateTimeField(default=timezone.now, editable=False)  # not auto_now_add, buffered messages keep their arrival time
     updated_date = models.DateTimeField(null=True, blank=True)
     status = models.CharField(choices=[("created", "created"), ("sent", "sent"), ("read", "read")], max_length=16, default="created")
 
@@ -44,10 +111,29 @@ class Message(models.Model):
         self.content = new_content
         await self.asave()
 
+    def update_status(self, new_status:str):
+        delta = int(new_status == "sent") - int(self.status == "sent")
+        with transaction.atomic():
+            self.status = new_status
+            self.save(update_fields=["status"])
+            if delta:
+                Chat.objects.filter(pk=self.chat_id).update(**unread_update(self.sender_id, delta))
+
     async def aupdate_status(self, new_status:str):
-        self.status = new_status
-        await self.asave()
+        await sync_to_async(self.update_status)(new_status)
+
+    def delete(self, *args, **kwargs):  # adelete goes through here too
+        with transaction.atomic():
+            res = super().delete(*args, **kwargs)
+            latest = Message.objects.filter(chat=OuterRef("pk")).order_by("-sent_date", "-pk")
+            Chat.objects.filter(pk=self.chat_id).update(
+                last_message=Subquery(latest.values("pk")[:1]),
+                last_message_at=Subquery(latest.values("sent_date")[:1]),
+                **(unread_update(self.sender_id, -1) if self.status == "sent" else {}),
+            )
+        return res
 
     class Meta:
-        ordering=["-sent_date"]
+        ordering=["-sent_date", "-id"]
+        indexes = [models.Index(fields=["chat", "-sent_date", "-id"])]
 
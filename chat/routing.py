@@ -5,4 +5,5 @@ from . import consumers
 websocket_urlpatterns = [
     re_path(r"ws/chat/(?P<room_name>[0-9a-f\-]+)/$", consumers.ChatConsumer.as_asgi()),
     path("ws/chats/list/", consumers.ChatListConsumer.as_asgi()),
+    path("ws/chats/", consumers.MultiChatConsumer.as_asgi()),  # chat list and subscribed chats on one socket
 ]
\ No newline at end of file
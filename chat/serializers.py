@@ -1,6 +1,6 @@
 from adrf.serializers import ModelSerializer
 from .models import Message, Chat
-from rest_framework.serializers import SlugRelatedField
+from rest_framework.serializers import SlugRelatedField, CharField, IntegerField, DateTimeField
 
 class MessageSerializer(ModelSerializer):
     sender = SlugRelatedField(slug_field="username", read_only=True)
@@ -13,4 +13,13 @@ class ChatSerializer(ModelSerializer):
     last_message = SlugRelatedField(slug_field="content", read_only=True)
     class Meta:
         model = Chat
-        fields = ["title", "chat_key", "last_message", "vacancy"]
\ No newline at end of file
+        fields = ["title", "chat_key", "last_message", "vacancy"]
+
+
+class ChatSummarySerializer(ModelSerializer):  # for Chat.objects.summaries()
+    last_message = CharField(source="last_message_content", read_only=True)
+    last_message_date = DateTimeField(read_only=True)
+    unread = IntegerField(read_only=True)
+    class Meta:
+        model = Chat
+        fields = ["title", "chat_key", "last_message", "vacancy", "unread", "last_message_date"]
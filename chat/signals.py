@@ -1,72 +1,46 @@
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
+from django.db import transaction
 from channels.layers import get_channel_layer
 from .models import Chat, Message
 from .serializers import ChatSerializer
+from .fanout import chat_list_fanout
+from .framing import chat_list_event
+from .history_cache import recent_history
 from asgiref.sync import sync_to_async
 
 
 @receiver(post_save, sender=Chat)
 async def chat_room_created_or_updated_handler(sender, instance, created, **kwargs): 
     if created:
+        await sync_to_async(recent_history.invalidate)(instance.chat_key)  # nothing cached under a reused key
         channel_layer = get_channel_layer()
         serializer = ChatSerializer(instance)
         event_payload = await sync_to_async(lambda:serializer.data)()
-        await channel_layer.group_send(
-            "chat_list_updates_"+str(instance.user1.pk),
-            {
-                "type": "chat.list.activity",
-                "event": "chat_created",
-                "chat_data": event_payload,
-            },
-        )
-        await channel_layer.group_send(
-            "chat_list_updates_"+str(instance.user2.pk),
-            {
-                "type": "chat.list.activity",
-                "event": "chat_created",
-                "chat_data": event_payload,
-            },
-        )
+        event = chat_list_event({"event": "chat_created", "chat_data": event_payload})  # encoded once for both participants
+        await channel_layer.group_send("chat_list_updates_"+str(instance.user1.pk), event)
+        await channel_layer.group_send("chat_list_updates_"+str(instance.user2.pk), event)
     else:  # TODO rename handler
         pass
 
 @receiver(pre_delete, sender=Chat)
 async def chat_room_deleted_handler(sender, instance, **kwargs):   
+    await sync_to_async(recent_history.invalidate)(instance.chat_key)
     channel_layer = get_channel_layer()
-    await channel_layer.group_send(
-        "chat_list_updates_"+str(instance.user1_id), 
-        {
-            "type": "chat.list.activity",
-            "event": "chat_deleted",
-            "chat_key": instance.chat_key,
-        },
-    )
-    await channel_layer.group_send(
-        "chat_list_updates_"+str(instance.user2_id),
-        {
-            "type": "chat.list.activity",
-            "event": "chat_deleted",
-            "chat_key": instance.chat_key,
-        },
-    )
+    event = chat_list_event({"event": "chat_deleted", "chat_key": instance.chat_key})
+    await channel_layer.group_send("chat_list_updates_"+str(instance.user1_id), event)
+    await channel_layer.group_send("chat_list_updates_"+str(instance.user2_id), event)
 
 @receiver(post_save, sender=Message)
-async def chat_list_last_message_update(sender, instance, **kwargs):
-    message = instance.content
-    chat = await sync_to_async(lambda:instance.chat)()
-    channel_layer = get_channel_layer()
-    await channel_layer.group_send(
-        "chat_list_updates_"+str(chat.user1_id),
-        {"type": "chat.list.activity",
-         "event": "last_update",
-         "chat_key": chat.chat_key,
-         "new_message":message}
+def chat_list_last_message_update(sender, instance, created, update_fields=None, **kwargs):  # sync, so on_commit sees the saving transaction
+    if update_fields is not None and set(update_fields) == {"status"}:  # not news for the chat list
+        return
+    if not created and not Chat.objects.filter(pk=instance.chat_id, last_message=instance.pk).exists():  # an edit of an older message
+        return
+    if Message.chat.is_cached(instance):  # the write paths pass the chat along, no query for the participants
+        chat = instance.chat
+    else:
+        chat = Chat.objects.only("chat_key", "user1", "user2").get(pk=instance.chat_id)
+    transaction.on_commit(  # chat lists never hear of a message that is rolled back
+        lambda: chat_list_fanout.publish((chat.user1_id, chat.user2_id), chat.chat_key, {"new_message": instance.content})
     )
-    await channel_layer.group_send(
-        "chat_list_updates_"+str(chat.user2_id),
-        {"type": "chat.list.activity",
-         "event": "last_update",
-         "chat_key": chat.chat_key,
-         "new_message":message}
-    )
\ No newline at end of file
@@ -6,7 +6,16 @@ from .routing import websocket_urlpatterns
 from cauth.models import User
 from .models import Chat, Message
 from rest_framework.authtoken.models import Token
-from asgiref.sync import sync_to_async
+from asgiref.sync import sync_to_async, async_to_sync
+from unittest import skipUnless
+from django.db import connection, transaction
+from .buffer import message_buffer
+from .fanout import chat_list_fanout
+from .framing import chat_group
+from channels.layers import get_channel_layer
+import asyncio
+import json
+import msgpack
 
 class ChatTestCase(TransactionTestCase):
     def setUp(self):
@@ -72,6 +81,39 @@ class ChatTestCase(TransactionTestCase):
             m = await Message.objects.aget(content="qqqqqwwwwww")
 
 
+    async def test_msgpack(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"ws/chat/1/?authorization={self.token}", subprotocols=["msgpack"])
+        communicator2 = self.get_communicator(f"ws/chat/1/?authorization={self.token2}")
+        self.assertEqual(await communicator.connect(), (True, "msgpack"))
+        await communicator2.connect()
+        await communicator.send_to(bytes_data=msgpack.packb({"type": "send.message", "message": "packed"}))
+        res = msgpack.unpackb(await communicator.receive_from())
+        res2 = await communicator2.receive_json_from()  # the same broadcast as JSON for the other participant
+        self.assertEqual(res, res2)
+        self.assertEqual(res["content"], "packed")
+        await communicator.disconnect()
+        await communicator2.disconnect()
+
+    async def test_history_cache(self):
+        communicator = self.get_communicator(f"ws/chat/1/?authorization={self.token}")
+        await communicator.connect()
+        for content in ("a", "b"):
+            await communicator.send_json_to({"type": "send.message", "message": content})
+            await communicator.receive_json_from()
+        await communicator.send_json_to({"type": "get_history"})
+        self.assertEqual([m["content"] for m in (await communicator.receive_json_from())["history"]], ["b", "a"])
+        await Message.objects.filter(content="a").aupdate(content="changed behind the cache")
+        b = await Message.objects.aget(content="b")
+        await communicator.send_json_to({"type": "edit.message", "message_pk": b.pk, "new_content": "B"})
+        await communicator.receive_json_from()
+        await communicator.send_json_to({"type": "send.message", "message": "c"})
+        await communicator.receive_json_from()
+        await communicator.send_json_to({"type": "get_history", "limit": 5})
+        self.assertEqual([m["content"] for m in (await communicator.receive_json_from())["history"]], ["c", "B", "a"])  # served from the cache
+        await communicator.send_json_to({"type": "get_history", "chunk": 1, "chunk_size": 2})
+        self.assertEqual([m["content"] for m in (await communicator.receive_json_from())["history"]], ["changed behind the cache"])  # older pages from the database
+        await communicator.disconnect()
+
     async def test_chats_list(self):
         u1, u2 = await self.get_users()
         communicator = self.get_communicator(f"ws/chats/list/?authorization={self.token}")
@@ -108,6 +150,55 @@ class ChatTestCase(TransactionTestCase):
         res2 = await communicator2.receive_json_from()
         self.assertEqual(res, res2)
         self.assertEqual(res["event_details"]["event"], "last_update")
+        first = await Message.objects.aget(content="messageee")
+        newest = await self.chat.astore_message(sender_pk=u1.pk, content="newest")
+        await communicator.receive_json_from()
+        await first.aupdate_status("read")
+        first.content = "edited"
+        await first.asave()
+        self.assertTrue(await communicator.receive_nothing())  # neither is the chat's newest message
+        newest.content = "newest edited"
+        await newest.asave()
+        res = await communicator.receive_json_from()
+        self.assertEqual(res["event_details"]["updates"], [{"chat_key": "1", "new_message": "newest edited"}])
+
+    async def test_chat_list_fanout(self):
+        u1, u2 = await self.get_users()
+        communicator = self.get_communicator(f"ws/chats/list/?authorization={self.token}")
+        await communicator.connect()
+        await communicator.receive_json_from()
+        for i, key in enumerate(["1", "1", "2", "1"]):
+            chat_list_fanout.publish((u1.pk, u2.pk), key, {"new_message": str(i)})  # returns without waiting for the window
+        res = await communicator.receive_json_from()
+        self.assertEqual(res["event_details"]["updates"], [{"chat_key": "1", "new_message": "3"}, {"chat_key": "2", "new_message": "2"}])
+        self.assertTrue(await communicator.receive_nothing())  # one event for the whole window
+
+        def rolled_back():
+            with transaction.atomic():
+                self.chat.store_message(u1.pk, "never sent", status="sent")
+                transaction.set_rollback(True)
+        await sync_to_async(rolled_back)()
+        self.assertTrue(await communicator.receive_nothing())  # published on commit only
+        await self.chat.astore_message(sender_pk=u1.pk, content="sent")
+        res = await communicator.receive_json_from()
+        self.assertEqual(res["event_details"]["updates"], [{"chat_key": "1", "new_message": "sent"}])
+
+    async def test_multiplexed(self):
+        communicator = self.get_communicator(f"ws/chats/?authorization={self.token}")
+        self.assertTrue((await communicator.connect())[0])
+        res = await communicator.receive_json_from()
+        self.assertEqual([c["chat_key"] for c in res["chats"]], ["1"])
+        await communicator.send_json_to({"type": "subscribe", "chat_keys": ["1", "2"]})
+        res = await communicator.receive_json_from()
+        self.assertEqual((res["chat_keys"], res["rejected"]), (["1"], ["2"]))
+        await communicator.send_json_to({"type": "send.message", "chat_key": "1", "message": "hi"})
+        events = {e.get("type"): e for e in [await communicator.receive_json_from(), await communicator.receive_json_from()]}
+        self.assertEqual((events["send.message"]["chat_key"], events["send.message"]["content"]), ("1", "hi"))
+        self.assertEqual(events["chat_list_update"]["event_details"]["updates"], [{"chat_key": "1", "new_message": "hi"}])
+        await communicator.send_json_to({"type": "get_history", "chat_key": "2"})
+        res = await communicator.receive_json_from()
+        self.assertEqual(res["error"], "Not subscribed to this chat")
+        await communicator.disconnect()
 
 
 class RESTChatsTestCase(TestCase):
@@ -120,3 +211,77 @@ class RESTChatsTestCase(TestCase):
         Chat.objects.create(user1=self.u1, user2=self.u2, chat_key="2")
         Chat.objects.create(user1=self.u1, user2=self.u2, chat_key="3")
         self.cloent = Client()
+
+    def test_chat_list(self):
+        chat = Chat.objects.get(chat_key="2")
+        chat.store_message(self.u2.pk, "first", status="sent")
+        chat.store_message(self.u2.pk, "second", status="sent")
+        chat.store_message(self.u1.pk, "own", status="sent")
+        with self.assertNumQueries(1):  # unread counts and last messages come with the chats
+            chats = list(Chat.objects.summaries(self.u1))
+        self.assertEqual([(i.chat_key, i.unread) for i in chats][0], ("2", 2))
+        res = self.cloent.get("/api/v1/chats/", headers={"Authorization": self.token1})
+        self.assertEqual(len(res.json()), 3)
+        self.assertEqual(res.json()[0]["last_message"], "own")  # latest activity first
+        self.assertEqual(res.json()[0]["unread"], 2)
+        res = self.cloent.get("/api/v1/chats/", headers={"Authorization": self.token2})
+        self.assertEqual(res.json()[0]["unread"], 1)
+
+    def test_chat_counters(self):
+        chat = Chat.objects.get(chat_key="1")
+        first = chat.store_message(self.u2.pk, "first", status="sent")
+        second = chat.store_message(self.u2.pk, "second", status="sent")
+        chat.refresh_from_db()
+        self.assertEqual((chat.user1_unread, chat.user2_unread, chat.last_message_id), (2, 0, second.pk))
+        first.update_status("read")
+        second.delete()
+        chat.refresh_from_db()
+        self.assertEqual((chat.user1_unread, chat.last_message_id), (0, first.pk))  # falls back to the previous message
+        first.delete()
+        chat.refresh_from_db()
+        self.assertEqual((chat.user1_unread, chat.last_message_id, chat.last_message_at), (0, None, None))
+
+    def test_chat_history(self):
+        chat = Chat.objects.get(chat_key="1")
+        messages = [chat.store_message(self.u1.pk, str(i)) for i in range(5)]
+        Message.objects.filter(chat=chat).update(sent_date=messages[0].sent_date)  # same timestamp, pk breaks the tie
+        res = self.cloent.get("/api/v1/chats/1/history/?limit=2", headers={"Authorization": self.token1}).json()
+        self.assertEqual([m["content"] for m in res["results"]], ["4", "3"])
+        res = self.cloent.get(f"/api/v1/chats/1/history/?limit=2&before={res['next']}", headers={"Authorization": self.token1}).json()
+        self.assertEqual([m["content"] for m in res["results"]], ["2", "1"])
+        res = self.cloent.get(f"/api/v1/chats/1/history/?limit=2&before={res['next']}", headers={"Authorization": self.token1}).json()
+        self.assertEqual(([m["content"] for m in res["results"]], res["next"]), (["0"], None))
+        res = self.cloent.get("/api/v1/chats/1/history/?before=yesterday", headers={"Authorization": self.token1})
+        self.assertEqual(res.status_code, 400)
+
+    @skipUnless(connection.vendor == "postgresql", "ids are allocated from the Postgres sequence")
+    def test_write_behind(self):
+        chat = Chat.objects.select_related("user1", "user2").get(chat_key="1")
+        first = async_to_sync(message_buffer.add)(chat, self.u2, "first")
+        second = async_to_sync(message_buffer.add)(chat, self.u2, "second")
+        self.assertLess(first.pk, second.pk)
+        async_to_sync(message_buffer.flush)()
+        self.assertEqual(list(chat.get_history().values_list("pk", flat=True)), [second.pk, first.pk])
+        chat.refresh_from_db()
+        self.assertEqual((chat.user1_unread, chat.user2_unread, chat.last_message_id), (2, 0, second.pk))
+        broken = async_to_sync(message_buffer.add)(chat, self.u2, "broken")
+        third = async_to_sync(message_buffer.add)(chat, self.u2, "third")
+        broken.status = None  # fails the batch, only this row is dropped
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(chat_group("1"), channel)
+        with self.assertLogs("chat.buffer", "ERROR"):
+            async_to_sync(message_buffer.flush)()
+        self.assertEqual(list(chat.get_history().values_list("pk", flat=True)), [third.pk, second.pk, first.pk])
+        event = json.loads(async_to_sync(layer.receive)(channel)["frames"]["json"])
+        self.assertEqual((event["type"], event["message_pk"]), ("delete.message", broken.pk))  # the room hears the message is gone
+
+    def test_mark_read(self):
+        chat = Chat.objects.get(chat_key="1")
+        messages = [chat.store_message(self.u2.pk, str(i), status="sent") for i in range(3)]
+        own = chat.store_message(self.u1.pk, "own", status="sent")
+        self.assertEqual(chat.mark_read(self.u1.pk, messages[1].pk), 2)
+        self.assertEqual(chat.mark_read(self.u1.pk, own.pk), 1)  # already read and own messages are not counted
+        chat.refresh_from_db()
+        self.assertEqual((chat.user1_unread, chat.user2_unread), (0, 1))
+        self.assertEqual(Message.objects.get(pk=own.pk).status, "sent")
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import ChatsAPIView
+from .views import ChatsAPIView, ChatListAPIView, ChatHistoryAPIView
 
 urlpatterns = [
+    path("", ChatListAPIView.as_view()),  # get, with unread counts and last messages
     path("<str:key>", ChatsAPIView.as_view()),
+    path("<str:key>/history/", ChatHistoryAPIView.as_view()),  # get, ?before=&limit=
 ]
\ No newline at end of file
@@ -1,18 +1,48 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .serializers import ChatSerializer
+from .serializers import ChatSerializer, ChatSummarySerializer, MessageSerializer
 from .models import Chat
 from django.db.models import Q
-from rest_framework.authentication import TokenAuthentication
+from cauth.authentication import CachedTokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_403_FORBIDDEN, HTTP_404_NOT_FOUND
+from cauth.pagination import get_limit
+
+
+class ChatListAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = ChatSummarySerializer(Chat.objects.summaries(request.user), many=True)
+        return Response(serializer.data)
 
 
 class ChatsAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request, key):
         chat = Chat.objects.get(chat_key=key)
         serializer = ChatSerializer(chat)
         return Response(serializer.data)
-        
\ No newline at end of file
+        
+
+class ChatHistoryAPIView(APIView):
+    authentication_classes = [CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, key):  # newest first, ?before=<next> for older pages
+        try:
+            chat = Chat.objects.get(chat_key=key)
+        except Chat.DoesNotExist:
+            return Response({"error": "No such chat"}, status=HTTP_404_NOT_FOUND)
+        if request.user.pk not in (chat.user1_id, chat.user2_id):
+            return Response({"error": "Forbidden"}, status=HTTP_403_FORBIDDEN)
+        try:
+            limit = get_limit(request.query_params)
+            messages = list(chat.get_history(before=request.query_params.get("before"), limit=limit + 1).select_related("sender"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=HTTP_400_BAD_REQUEST)
+        data = MessageSerializer(messages[:limit], many=True).data
+        return Response({"results": data, "next": data[-1]["pk"] if len(messages) > limit else None})
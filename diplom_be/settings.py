@@ -21,6 +21,7 @@ class Dev(Configuration):
         'django.contrib.sessions',
         'django.contrib.messages',
         'django.contrib.staticfiles',
+        'django.contrib.postgres',
         'chat',
         'cauth',
         'rest_framework',
@@ -108,6 +109,8 @@ class Dev(Configuration):
 
     DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+    CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', 'false').lower() == 'true'  # postgres only, see chat/buffer.py
+
     CHANNEL_LAYERS = {
         "default": {
             "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -120,7 +123,7 @@ class Dev(Configuration):
 
     REST_FRAMEWORK = {
         'DEFAULT_AUTHENTICATION_CLASSES': [
-            'rest_framework.authentication.TokenAuthentication',
+            'cauth.authentication.CachedTokenAuthentication',
         ],
         
         'DEFAULT_FILTER_BACKENDS': [